@@ -0,0 +1,212 @@
+import atexit
+import collections
+import os
+import sys
+import threading
+import time
+
+# What record() does when the buffer is full
+DROP_POLICIES = ("drop-newest", "drop-oldest", "block")
+
+# Characters escaped in logged strings, as Apache does: quotes, backslashes
+# and control characters, so a request cannot forge log lines
+ESCAPES = {ord('"'): '\\"', ord("\\"): "\\\\"}
+ESCAPES.update({code: f"\\x{code:02x}" for code in [*range(32), 127]})
+
+# Stands in for the request of a response sent before one was parsed
+NO_REQUEST = (None, None, None, {})
+
+
+def escape(value):
+    return value.translate(ESCAPES)
+
+
+class AccessLog:
+    """Access log in Common or Combined Log Format, written off the request path.
+
+    record() only appends one tuple of the request's fields to a bounded
+    deque, which is safe to share between threads without a lock. A
+    writer thread wakes every `flush_interval` seconds, or as soon as
+    `batch_size` records are waiting, formats everything buffered and
+    writes it with one write() call. The file is rotated to `path.1` ...
+    `path.<backups>` when it would grow past `max_bytes`, or every
+    `rotate_seconds`; 0 disables either trigger. A `path` of "-" logs to
+    standard output without rotation.
+
+    When the writer falls behind and `capacity` records are waiting,
+    `drop_policy` decides: "drop-newest" discards the new record,
+    "drop-oldest" discards the oldest waiting one, and "block" makes the
+    request thread wait for room. Drops are counted in stats(). The
+    capacity check is not atomic with the append, so concurrent threads
+    may overshoot it by a few records.
+    """
+
+    def __init__(self, path, combined=True, capacity=8192, batch_size=256, flush_interval=0.5,
+                 max_bytes=64 * 1024 * 1024, rotate_seconds=0, backups=5, drop_policy="drop-newest"):
+        if drop_policy not in DROP_POLICIES:
+            raise ValueError(f"Unknown drop policy {drop_policy!r}; expected one of {', '.join(DROP_POLICIES)}")
+        self.path = path
+        self.combined = combined
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_bytes = max_bytes
+        self.rotate_seconds = rotate_seconds
+        self.backups = backups
+        self.drop_policy = drop_policy
+        self._records = collections.deque()
+        self._wake = threading.Event()
+        self._space = threading.Condition()  # Blocked producers wait here
+        self._lock = threading.Lock()  # Guards the drop counter, only taken when full
+        self._writer = None
+        self._closing = False
+        self._file = None
+        self._size = 0
+        self._next_rotation = 0.0
+        self._stamp_second = None
+        self._stamp = ""
+        self.written = 0
+        self.dropped = 0
+        self.rotations = 0
+
+    def record(self, client_ip, request, status, nbytes):
+        """Queue one request for the log. Cheap enough to call on every request.
+
+        `request` is None for responses sent before a request was parsed
+        (400, 431, 503 at accept); their request line is logged as "-".
+        """
+        method, path, version, headers = request if request is not None else NO_REQUEST
+        records = self._records
+        if len(records) >= self.capacity:
+            if self.drop_policy == "drop-newest":
+                with self._lock:
+                    self.dropped += 1
+                return
+            if self.drop_policy == "drop-oldest":
+                try:
+                    records.popleft()
+                except IndexError:
+                    pass  # The writer drained it meanwhile
+                else:
+                    with self._lock:
+                        self.dropped += 1
+            else:
+                self._wake.set()
+                with self._space:
+                    while len(records) >= self.capacity and not self._closing:
+                        self._space.wait(self.flush_interval)
+
+        if self.combined:
+            records.append((time.time(), client_ip, method, path, version, status, nbytes,
+                            headers.get("referer", "-"), headers.get("user-agent", "-")))
+        else:
+            records.append((time.time(), client_ip, method, path, version, status, nbytes))
+        if len(records) >= self.batch_size and not self._wake.is_set():
+            self._wake.set()
+
+    def _format(self, record):
+        timestamp, client_ip, method, path, version, status, nbytes, *agent = record
+        second = int(timestamp)
+        if second != self._stamp_second:
+            self._stamp_second = second
+            self._stamp = time.strftime("%d/%b/%Y:%H:%M:%S %z", time.localtime(second))
+        request_line = "-" if method is None else f"{escape(method)} {escape(path)} {escape(version)}"
+        line = f'{client_ip} - - [{self._stamp}] "{request_line}" {status} {nbytes or "-"}'
+        if agent:
+            referer, user_agent = agent
+            line += f' "{escape(referer)}" "{escape(user_agent)}"'
+        return line + "\n"
+
+    def start(self):
+        """Open the log and start the writer thread."""
+        if self._writer is not None:
+            return
+        self._open()
+        self._writer = threading.Thread(target=self._run, name="access-log-writer", daemon=True)
+        self._writer.start()
+        atexit.register(self.close)
+
+    def _open(self):
+        if self.path == "-":
+            self._file = sys.stdout.buffer
+            return
+        self._file = open(self.path, "ab")
+        self._size = self._file.tell()
+        if self.rotate_seconds > 0:
+            self._next_rotation = time.time() + self.rotate_seconds
+
+    def _run(self):
+        while not self._closing:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            self._flush()
+        self._flush()
+
+    def _flush(self):
+        """Write out everything buffered so far."""
+        records = self._records
+        lines = []
+        for _ in range(len(records)):
+            try:
+                record = records.popleft()
+            except IndexError:
+                break  # drop-oldest producers popped the rest meanwhile
+            lines.append(self._format(record))
+        if self.drop_policy == "block":
+            with self._space:
+                self._space.notify_all()
+        if not lines:
+            return
+        data = "".join(lines).encode("utf-8", "backslashreplace")
+        try:
+            if self._should_rotate(len(data)):
+                self._rotate()
+            self._file.write(data)
+            self._file.flush()
+        except OSError as e:
+            print("Error writing access log:", e)
+            return
+        self._size += len(data)
+        self.written += len(lines)
+
+    def _should_rotate(self, incoming):
+        if self.path == "-":
+            return False
+        if self.max_bytes > 0 and self._size > 0 and self._size + incoming > self.max_bytes:
+            return True
+        return self.rotate_seconds > 0 and time.time() >= self._next_rotation
+
+    def _rotate(self):
+        """Shift path.N-1 -> path.N, ..., path -> path.1 and start a new file."""
+        self._file.close()
+        for index in range(self.backups - 1, 0, -1):
+            if os.path.exists(f"{self.path}.{index}"):
+                os.replace(f"{self.path}.{index}", f"{self.path}.{index + 1}")
+        if self.backups > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self.rotations += 1
+        self._open()
+
+    def close(self):
+        """Flush what is buffered and stop the writer."""
+        if self._writer is None or self._closing:
+            return
+        self._closing = True
+        self._wake.set()
+        self._writer.join(timeout=5)
+        if self._file is not None and self.path != "-":
+            self._file.close()
+
+    def stats(self):
+        return {
+            "path": self.path,
+            "format": "combined" if self.combined else "common",
+            "pending": len(self._records),
+            "capacity": self.capacity,
+            "drop_policy": self.drop_policy,
+            "written": self.written,
+            "dropped": self.dropped,
+            "rotations": self.rotations,
+        }
@@ -0,0 +1,57 @@
+import threading
+import time
+
+
+class AdmissionControl:
+    """Bounded queue in front of a ThreadPoolExecutor.
+
+    ThreadPoolExecutor queues submitted work without limit, so under
+    overload every request waits behind an ever-growing backlog. Here at
+    most `max_pending` items may wait for a free thread. Beyond that,
+    try_submit refuses immediately and the caller answers 503 instead of
+    letting the client time out. The time each item spends queued is
+    passed to `on_wait` in nanoseconds.
+    """
+
+    def __init__(self, executor, max_pending, on_wait=None):
+        self.executor = executor
+        self.max_pending = max_pending
+        self.on_wait = on_wait
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.total_wait_ns = 0
+
+    def try_submit(self, fn, *args):
+        """Queue fn(*args) for a pool thread. Returns False if the queue is full."""
+        with self._lock:
+            if self._pending >= self.max_pending:
+                self.rejected += 1
+                return False
+            self._pending += 1
+            self.admitted += 1
+        self.executor.submit(self._run, time.perf_counter_ns(), fn, args)
+        return True
+
+    def _run(self, enqueued_ns, fn, args):
+        waited = time.perf_counter_ns() - enqueued_ns
+        with self._lock:
+            self._pending -= 1
+            self.total_wait_ns += waited
+        if self.on_wait is not None:
+            self.on_wait(waited)
+        fn(*args)
+
+    def pending(self):
+        return self._pending
+
+    def stats(self):
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "max_pending": self.max_pending,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "mean_wait_ms": round(self.total_wait_ns / self.admitted / 1e6, 3) if self.admitted else 0.0,
+            }
@@ -0,0 +1,108 @@
+import os
+import stat
+import tarfile
+import zipfile
+
+# Bytes read from a member file at a time; also the most an archive stream buffers
+READ_SIZE = 64 * 1024
+
+# Content-Type of each supported ?archive= format
+ARCHIVE_TYPES = {"tar": "application/x-tar", "zip": "application/zip"}
+
+
+def tar_stream(members, on_file=None):
+    """A ustar/pax archive of `members`, (path, arcname) pairs, yielded in pieces of at most READ_SIZE.
+
+    Nothing is buffered beyond one read. Each header is built from the
+    stat of the open file; a file that grows while it is sent is cut at
+    that size and one that shrinks is padded with zeros, so the archive
+    stays well formed. Files that cannot be opened are skipped.
+    `on_file(path)` is called for every file included.
+    """
+    for path, arcname in members:
+        try:
+            f = open(path, "rb")
+        except OSError:
+            continue
+        with f:
+            stat_result = os.fstat(f.fileno())
+            if not stat.S_ISREG(stat_result.st_mode):
+                continue
+            info = tarfile.TarInfo(arcname)
+            info.size = stat_result.st_size
+            info.mtime = int(stat_result.st_mtime)
+            info.mode = 0o644
+            yield info.tobuf(tarfile.PAX_FORMAT)
+            if on_file is not None:
+                on_file(path)
+            remaining = info.size
+            while remaining > 0:
+                chunk = f.read(min(READ_SIZE, remaining))
+                if not chunk:
+                    chunk = bytes(min(READ_SIZE, remaining))  # Shrunk since the stat
+                remaining -= len(chunk)
+                yield chunk
+            if info.size % tarfile.BLOCKSIZE:
+                yield bytes(tarfile.BLOCKSIZE - info.size % tarfile.BLOCKSIZE)
+    # Two zero blocks end the archive; tar pads it to a whole record
+    yield bytes(tarfile.RECORDSIZE)
+
+
+class _Sink:
+    """Write-only, unseekable file object that holds what is written until it is taken."""
+
+    def __init__(self):
+        self._parts = []
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def take(self):
+        data = b"".join(self._parts)
+        self._parts = []
+        return data
+
+
+def zip_stream(members, on_file=None, compressible=lambda path: False):
+    """A zip archive of `members`, (path, arcname) pairs, yielded as it is written.
+
+    zipfile writes to an unseekable sink, so sizes and CRCs go into a data
+    descriptor after each member and nothing is buffered beyond one read
+    and its compressed output. Members for which `compressible(path)` is
+    true are deflated, others stored. Files that cannot be opened are
+    skipped; `on_file(path)` is called for every file included.
+    """
+    sink = _Sink()
+    with zipfile.ZipFile(sink, "w") as archive:
+        for path, arcname in members:
+            try:
+                f = open(path, "rb")
+            except OSError:
+                continue
+            with f:
+                stat_result = os.fstat(f.fileno())
+                if not stat.S_ISREG(stat_result.st_mode):
+                    continue
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                info.file_size = stat_result.st_size  # zipfile decides on Zip64 fields from it
+                info.compress_type = zipfile.ZIP_DEFLATED if compressible(path) else zipfile.ZIP_STORED
+                if on_file is not None:
+                    on_file(path)
+                with archive.open(info, "w") as member:
+                    while True:
+                        chunk = f.read(READ_SIZE)
+                        if not chunk:
+                            break
+                        member.write(chunk)
+                        data = sink.take()
+                        if data:
+                            yield data
+            data = sink.take()
+            if data:
+                yield data
+    # Closing the archive wrote the central directory
+    yield sink.take()
@@ -0,0 +1,493 @@
+import json
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.request
+from collections import defaultdict
+
+from access_log import AccessLog
+from counters import ShardedCounter
+from http_parser import Request, RequestParser
+from load_generator import print_comparison, run_load
+
+SERVER_SCRIPT = "multithreaded_server.py"
+BASE_PORT = 8090
+
+# Serving modes compared side by side: name -> extra server flags
+MODES = {
+    "blocking": ["--blocking-pool"],
+    "pool": [],
+    "async": ["--async"],
+    "prefork": ["--workers", "4"],
+}
+
+# Concurrency backends of the shared pipeline compared by `benchmark.py backends`: name -> server flags
+BACKEND_VARIANTS = {
+    "serial": ["--backend", "serial"],
+    "thread": ["--backend", "thread"],
+    "blocking-pool": ["--backend", "blocking-pool"],
+    "pool": ["--backend", "pool"],
+    "async": ["--backend", "async"],
+    "prefork-4": ["--backend", "pool", "--workers", "4"],
+}
+
+# Workloads every backend is driven with: name -> (path, keep_alive)
+BACKEND_WORKLOADS = {
+    "listing": ("/", False),
+    "small file": ("/index.html", True),
+    "pdf": ("/subdir/1.pdf", True),
+}
+
+# Worker pool variants compared under --delay: name -> extra server flags
+POOL_VARIANTS = {
+    "fixed-10": ["--min-workers", "10", "--max-workers", "10"],
+    "adaptive": [],
+}
+
+
+def start_server(directory, port, flags):
+    """Start a server variant in a subprocess and wait until it accepts connections."""
+    process = subprocess.Popen(
+        [sys.executable, SERVER_SCRIPT, directory, "--port", str(port), "--rate-limit", "0"] + flags,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.time() + 10
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return process
+        except OSError:
+            time.sleep(0.1)
+    process.kill()
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def stop_server(process):
+    process.terminate()
+    try:
+        process.wait(timeout=5)
+    except subprocess.TimeoutExpired:
+        process.kill()
+
+
+def open_idle_connections(port, count):
+    """Open connections that never send a request, like slow or idle clients."""
+    sockets = []
+    for _ in range(count):
+        try:
+            sockets.append(socket.create_connection(("127.0.0.1", port), timeout=5))
+        except OSError:
+            break
+    return sockets
+
+
+def process_tree(pid):
+    """`pid` and all its descendants (Linux /proc)."""
+    pids = [pid]
+    for current in pids:
+        try:
+            for task in os.listdir(f"/proc/{current}/task"):
+                with open(f"/proc/{current}/task/{task}/children") as f:
+                    pids.extend(int(child) for child in f.read().split())
+        except OSError:
+            pass
+    return pids
+
+
+def cpu_seconds(pids):
+    """User + system CPU time consumed so far by `pids`, or None without /proc."""
+    total = 0
+    try:
+        for pid in pids:
+            with open(f"/proc/{pid}/stat") as f:
+                fields = f.read().rpartition(")")[2].split()
+            total += int(fields[11]) + int(fields[12])  # utime, stime in clock ticks
+    except OSError:
+        return None
+    return total / os.sysconf("SC_CLK_TCK")
+
+
+def rss_mib(pids):
+    """Resident memory of `pids` in MiB, or None without /proc."""
+    total = 0
+    try:
+        for pid in pids:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+    except OSError:
+        return None
+    return total / 1024
+
+
+def compare_backends(directory, concurrency, duration, output=None):
+    """Drive every backend with the same workloads; table of throughput, p99, server CPU and RSS."""
+    rows = []
+    for index, (backend, flags) in enumerate(BACKEND_VARIANTS.items()):
+        port = BASE_PORT + index
+        process = start_server(directory, port, flags)
+        try:
+            time.sleep(0.5)  # Let prefork workers start
+            pids = process_tree(process.pid)
+            for workload, (path, keep_alive) in BACKEND_WORKLOADS.items():
+                cpu_before = cpu_seconds(pids)
+                result = run_load(f"http://127.0.0.1:{port}{path}", "closed", concurrency=concurrency,
+                                  duration=duration, keep_alive=keep_alive, timeout=10.0)
+                cpu_after = cpu_seconds(pids)
+                summary = result.summary()
+                cpu = None
+                if cpu_before is not None and cpu_after is not None and summary["elapsed_s"]:
+                    cpu = (cpu_after - cpu_before) / summary["elapsed_s"] * 100
+                rows.append((backend, workload, summary, cpu, rss_mib(pids)))
+        finally:
+            stop_server(process)
+
+    header = ["backend", "workload", "req/s", "p99 ms", "errors", "CPU %", "RSS MiB"]
+    lines = ["| " + " | ".join(header) + " |", "|" + "---|" * len(header)]
+    for backend, workload, summary, cpu, rss in rows:
+        latency = summary["latency"]
+        cells = [
+            backend, workload, f"{summary['throughput_rps']:.1f}",
+            f"{latency['p99_ms']:.2f}" if latency["count"] else "-", str(summary["errors"]),
+            f"{cpu:.0f}" if cpu is not None else "-", f"{rss:.1f}" if rss is not None else "-",
+        ]
+        lines.append("| " + " | ".join(cells) + " |")
+    title = (f"Backends on '{directory}': {concurrency} clients, {duration}s per workload "
+             f"({', '.join(f'{name} = {path}' for name, (path, _) in BACKEND_WORKLOADS.items())})")
+    print(f"\n{title}\n")
+    print("\n".join(lines))
+    if output:
+        with open(output, "w") as f:
+            f.write(f"{title}\n\n" + "\n".join(lines) + "\n")
+        print(f"\nTable written to {output}")
+
+
+def compare_modes(directory, path, concurrency, duration, idle, keep_alive=False):
+    """Benchmark every entry in MODES under the same workload and print a table."""
+    rows = []
+    for index, (name, flags) in enumerate(MODES.items()):
+        port = BASE_PORT + index
+        process = start_server(directory, port, flags)
+        idle_sockets = open_idle_connections(port, idle)
+        try:
+            result = run_load(f"http://127.0.0.1:{port}{path}", "closed", concurrency=concurrency,
+                              duration=duration, keep_alive=keep_alive, timeout=5.0)
+        finally:
+            for s in idle_sockets:
+                s.close()
+            stop_server(process)
+        rows.append((name, result.summary()))
+
+    print(f"\n{'='*98}")
+    print(f"path={path} concurrency={concurrency} idle={idle} duration={duration}s keep_alive={keep_alive}")
+    print(f"{'='*98}")
+    print_comparison(rows)
+
+
+def compare_pools(directory, path, concurrency, duration, front_end=False):
+    """Benchmark the fixed and adaptive worker pools with the 1 s --delay, and report pool sizes."""
+    scenario = ["--delay"] if front_end else ["--delay", "--blocking-pool"]
+    rows = []
+    sizes = []
+    for index, (name, flags) in enumerate(POOL_VARIANTS.items()):
+        port = BASE_PORT + index
+        process = start_server(directory, port, scenario + flags)
+        try:
+            result = run_load(f"http://127.0.0.1:{port}{path}", "closed", concurrency=concurrency,
+                              duration=duration, timeout=30.0)
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/__stats", timeout=5) as response:
+                pool = json.load(response)["pool"]
+        finally:
+            stop_server(process)
+        rows.append((name, result.summary()))
+        sizes.append((name, pool))
+
+    print(f"\n{'='*98}")
+    print(f"{' '.join(scenario)}: path={path} concurrency={concurrency} duration={duration}s")
+    print(f"{'='*98}")
+    print_comparison(rows)
+    for name, pool in sizes:
+        print(f"{name:<12} threads now {pool['threads']}, peak {pool['peak']} (min {pool['min']}, max {pool['max']})")
+
+
+def legacy_counter():
+    """The original scheme: one defaultdict behind one global lock."""
+    counts = defaultdict(int)
+    lock = threading.Lock()
+
+    def increment(key):
+        with lock:
+            counts[key] += 1
+
+    def read(keys):
+        # The old listing took the lock once per entry
+        values = []
+        for key in keys:
+            with lock:
+                values.append(counts[key])
+        return values
+
+    return increment, read, counts
+
+
+def sharded_counter():
+    counter = ShardedCounter()
+    return counter.increment, counter.snapshot, counter
+
+
+def time_counter(factory, workers, increments, keys, read_every):
+    """Run `workers` threads that each count `increments` hits; every `read_every`-th hit also reads a listing."""
+    increment, read, _ = factory()
+    barrier = threading.Barrier(workers + 1)
+
+    def worker(offset):
+        barrier.wait()
+        for i in range(increments):
+            increment(keys[(offset + i) % len(keys)])
+            if read_every and i % read_every == 0:
+                read(keys)
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(workers)]
+    for thread in threads:
+        thread.start()
+    barrier.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    total = sum(read(keys))
+    return elapsed, total
+
+
+def compare_counters(worker_counts, total_increments, read_every):
+    """Microbenchmark the legacy global-lock counter against ShardedCounter."""
+    keys = [f"content/file_{n}.pdf" for n in range(16)]
+    reads = f"listing read every {read_every} increments" if read_every else "no listing reads"
+    print(f"\n{'='*70}")
+    print(f"{total_increments} increments per run, {reads}")
+    print(f"{'='*70}")
+    print(f"{'workers':>8}{'counter':>10}{'seconds':>10}{'incr/s':>12}{'exact':>8}")
+    for workers in worker_counts:
+        increments = total_increments // workers
+        expected = increments * workers
+        for name, factory in (("legacy", legacy_counter), ("sharded", sharded_counter)):
+            elapsed, total = time_counter(factory, workers, increments, keys, read_every)
+            print(f"{workers:>8}{name:>10}{elapsed:>10.3f}{expected / elapsed:>12.0f}{str(total == expected):>8}")
+
+
+BROWSER_HEAD = (
+    b"GET /subdir/report.pdf HTTP/1.1\r\n"
+    b"Host: localhost:8080\r\n"
+    b"User-Agent: Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0\r\n"
+    b"Accept: text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8\r\n"
+    b"Accept-Language: en-US,en;q=0.5\r\n"
+    b"Accept-Encoding: gzip, deflate, br\r\n"
+    b"Connection: keep-alive\r\n"
+    b"Referer: http://localhost:8080/subdir/\r\n"
+    b"Upgrade-Insecure-Requests: 1\r\n"
+    b"Sec-Fetch-Dest: document\r\n"
+    b"Sec-Fetch-Mode: navigate\r\n"
+    b"Sec-Fetch-Site: same-origin\r\n"
+    b"If-None-Match: \"ce8011-300000-18df2be51e8a5320\"\r\n"
+    b"Priority: u=0, i\r\n"
+)
+
+# Parser workloads: name -> (reads as they arrive on one connection, requests they contain)
+PARSER_WORKLOADS = {
+    "curl": ([b"GET / HTTP/1.1\r\nHost: localhost:8080\r\nUser-Agent: curl/8.5.0\r\nAccept: */*\r\n\r\n"], 1),
+    "browser": ([BROWSER_HEAD + b"\r\n"], 1),
+    "cookie-4k": ([BROWSER_HEAD + b"Cookie: " + b"s=" + b"x" * 4096 + b"\r\n\r\n"], 1),
+    "cookie-4k/256B reads": (None, 1),
+    "pipelined-10": ([(BROWSER_HEAD + b"\r\n") * 10], 10),
+}
+cookie_request = PARSER_WORKLOADS["cookie-4k"][0][0]
+PARSER_WORKLOADS["cookie-4k/256B reads"] = (
+    [cookie_request[i:i + 256] for i in range(0, len(cookie_request), 256)], 1)
+
+
+def legacy_parse(reads):
+    """The original handle_client: one recv(2048), decoded, only the request line split; headers ignored."""
+    request = reads[0][:2048].decode("utf-8", errors="ignore")
+    method, path, _ = request.splitlines()[0].split()
+    return 1
+
+
+def previous_parse(reads):
+    """The bytes-buffer parser this module replaced: rescan and re-slice the whole buffer per read."""
+    count = 0
+    buffer = b""
+    for chunk in reads:
+        buffer += chunk
+        while True:
+            end = buffer.find(b"\r\n\r\n")
+            if end < 0:
+                break
+            lines = bytes(buffer[:end]).decode("iso-8859-1").split("\r\n")
+            method, path, version = lines[0].split()
+            headers = {}
+            for line in lines[1:]:
+                name, sep, value = line.partition(":")
+                headers[name.strip().lower()] = value.strip()
+            request = Request(method, path, version, headers)
+            body_end = end + 4 + int(headers.get("content-length", 0))
+            request.headers.get("connection")
+            buffer = buffer[body_end:]
+            count += 1
+    return count
+
+
+def incremental_parse(reads):
+    count = 0
+    parser = RequestParser()
+    for chunk in reads:
+        parser.feed(chunk)
+        while True:
+            request = parser.next_request()
+            if request is None:
+                break
+            request.headers.get("connection")  # Every request looks up at least this header
+            count += 1
+    return count
+
+
+def time_parser(parse, reads, requests, repeats=5, min_seconds=0.1):
+    """Best-of-`repeats` microseconds per request, or None if `parse` cannot handle the workload."""
+    try:
+        if parse(reads) != requests:
+            return None
+    except ValueError:
+        return None
+    best = None
+    for _ in range(repeats):
+        iterations = 0
+        start = time.perf_counter()
+        while True:
+            for _ in range(100):
+                parse(reads)
+            iterations += 100
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_seconds:
+                break
+        micros = elapsed / iterations / requests * 1e6
+        best = micros if best is None else min(best, micros)
+    return best
+
+
+def compare_access_log(directory, path, concurrency, duration):
+    """Benchmark the server without and with --access-log, and the cost of one record() call."""
+    with tempfile.TemporaryDirectory() as log_dir:
+        log_path = os.path.join(log_dir, "access.log")
+        rows = []
+        for index, (name, flags) in enumerate((("no log", []), ("access log", ["--access-log", log_path]))):
+            port = BASE_PORT + index
+            process = start_server(directory, port, flags)
+            try:
+                result = run_load(f"http://127.0.0.1:{port}{path}", "closed", concurrency=concurrency,
+                                  duration=duration, keep_alive=True, timeout=5.0)
+            finally:
+                stop_server(process)
+            rows.append((name, result.summary()))
+        with open(log_path, "rb") as f:
+            logged = sum(1 for _ in f)
+
+    log = AccessLog(os.devnull)
+    request = Request("GET", path, "HTTP/1.1", {"user-agent": "benchmark", "referer": "-"})
+    records = min(200000, log.capacity - 1)
+    start = time.perf_counter()
+    for _ in range(records):
+        log.record("127.0.0.1", request, 200, 1024)
+    record_ns = (time.perf_counter() - start) / records * 1e9
+    log.start()
+    log.close()
+
+    print(f"\n{'='*98}")
+    print(f"path={path} concurrency={concurrency} duration={duration}s keep_alive=True")
+    print(f"{'='*98}")
+    print_comparison(rows)
+    print(f"Lines written by the logging run: {logged}")
+    print(f"record() on the request path: {record_ns:.0f} ns (formatting and writing happen on the writer thread)")
+
+
+def compare_parsers():
+    """Microbenchmark the original, previous and incremental request parsing."""
+    parsers = (("legacy", legacy_parse), ("previous", previous_parse), ("incremental", incremental_parse))
+    print(f"\n{'='*76}")
+    print("Microseconds per parsed request (lower is better); - = workload not handled")
+    print(f"{'='*76}")
+    print(f"{'workload':<24}{'bytes':>8}" + "".join(f"{name:>14}" for name, _ in parsers))
+    for name, (reads, requests) in PARSER_WORKLOADS.items():
+        row = f"{name:<24}{sum(map(len, reads)) // requests:>8}"
+        for _, parse in parsers:
+            if parse is legacy_parse and (requests > 1 or len(reads) > 1 or len(reads[0]) > 2048):
+                micros = None  # A single recv(2048) cannot see the rest of the request
+            else:
+                micros = time_parser(parse, reads, requests)
+            row += f"{micros:>14.2f}" if micros is not None else f"{'-':>14}"
+        print(row)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Benchmarks for the HTTP server")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    modes_parser = subparsers.add_parser("modes", help="Compare server serving modes locally")
+    modes_parser.add_argument("directory", nargs="?", default="content", help="Directory to serve")
+    modes_parser.add_argument("--path", default="/", help="URL path to request (default: /)")
+    modes_parser.add_argument("--concurrency", type=int, default=50, help="Concurrent clients (default: 50)")
+    modes_parser.add_argument("--duration", type=float, default=5, help="Seconds per mode (default: 5)")
+    modes_parser.add_argument("--idle", type=int, default=0,
+                              help="Idle connections held open during the run (default: 0)")
+    modes_parser.add_argument("--keep-alive", action="store_true", help="Reuse client connections")
+
+    backends_parser = subparsers.add_parser("backends", help="Every concurrency backend under identical workloads")
+    backends_parser.add_argument("directory", nargs="?", default="content", help="Directory to serve")
+    backends_parser.add_argument("--concurrency", type=int, default=20, help="Concurrent clients (default: 20)")
+    backends_parser.add_argument("--duration", type=float, default=5, help="Seconds per workload (default: 5)")
+    backends_parser.add_argument("--output", help="Also write the table as Markdown to this file")
+
+    pool_parser = subparsers.add_parser("pool", help="Fixed vs adaptive worker pool under --delay")
+    pool_parser.add_argument("directory", nargs="?", default="content", help="Directory to serve")
+    pool_parser.add_argument("--path", default="/", help="URL path to request (default: /)")
+    pool_parser.add_argument("--concurrency", type=int, default=50, help="Concurrent clients (default: 50)")
+    pool_parser.add_argument("--duration", type=float, default=10, help="Seconds per variant (default: 10)")
+    pool_parser.add_argument("--front-end", action="store_true",
+                             help="Keep the selector front end (its --delay does not hold workers)")
+
+    subparsers.add_parser("parser", help="Request parser microbenchmark")
+
+    log_parser = subparsers.add_parser("accesslog", help="Throughput without and with the access log")
+    log_parser.add_argument("directory", nargs="?", default="content", help="Directory to serve")
+    log_parser.add_argument("--path", default="/index.html", help="URL path to request (default: /index.html)")
+    log_parser.add_argument("--concurrency", type=int, default=20, help="Concurrent clients (default: 20)")
+    log_parser.add_argument("--duration", type=float, default=5, help="Seconds per variant (default: 5)")
+
+    counters_parser = subparsers.add_parser("counters", help="Request counter contention microbenchmark")
+    counters_parser.add_argument("--workers", type=int, nargs="+", default=[10, 50, 200],
+                                 help="Worker thread counts (default: 10 50 200)")
+    counters_parser.add_argument("--increments", type=int, default=200000,
+                                 help="Total increments per run (default: 200000)")
+    counters_parser.add_argument("--read-every", type=int, default=20,
+                                 help="Read a 16-entry listing every N increments, 0 for none (default: 20)")
+
+    args = parser.parse_args()
+
+    if args.command == "modes":
+        compare_modes(args.directory, args.path, args.concurrency, args.duration, args.idle, args.keep_alive)
+    elif args.command == "backends":
+        compare_backends(args.directory, args.concurrency, args.duration, args.output)
+    elif args.command == "pool":
+        compare_pools(args.directory, args.path, args.concurrency, args.duration, args.front_end)
+    elif args.command == "parser":
+        compare_parsers()
+    elif args.command == "accesslog":
+        compare_access_log(args.directory, args.path, args.concurrency, args.duration)
+    elif args.command == "counters":
+        compare_counters(args.workers, args.increments, args.read_every)
@@ -1,7 +1,41 @@
 import socket
 import sys
 import os
+import time
+import threading
+import queue
+import email.utils
+import urllib.parse
+from html.parser import HTMLParser
 BUFFER_SIZE = 4096
+MIRROR_CHUNK_SIZE = 64 * 1024  # Bytes read from the socket and written to disk at a time
+MIRROR_CONNECTIONS = 4  # Keep-alive connections (and download threads) used by --mirror
+MIRROR_RETRIES = 10  # Attempts per URL answered with 429 or 503 before giving up
+PARTIAL_SUFFIX = ".part"  # Interrupted downloads, resumed with a Range request
+VALIDATOR_SUFFIX = ".part.etag"  # ETag of the partial download, sent as If-Range
+
+def read_content_length(header_str):
+    for line in header_str.split("\r\n"):
+        if line.lower().startswith("content-length:"):
+            return int(line.split(":", 1)[1].strip())
+    return None
+
+def is_chunked(header_str):
+    for line in header_str.split("\r\n"):
+        if line.lower().startswith("transfer-encoding:"):
+            return "chunked" in line.lower()
+    return False
+
+def decode_chunked(data):
+    """Body carried by a complete chunked message body; stops at the last chunk, or where the data ends."""
+    body = b""
+    while True:
+        size_line, _, data = data.partition(b"\r\n")
+        size = int(size_line.split(b";")[0].strip() or b"0", 16)
+        if size == 0:
+            return body
+        body += data[:size]
+        data = data[size + 2:]
 
 def http_get(host, port, filename, save_dir):
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
@@ -22,7 +56,16 @@ def http_get(host, port, filename, save_dir):
                 content_type = line.split(":", 1)[1].strip().split(";")[0]
                 break
         if content_type == "text/html":
-            body = rest + s.recv(BUFFER_SIZE)
+            # Read the whole body: up to Content-Length, or until the server closes
+            length = read_content_length(header_str)
+            body = rest
+            while length is None or len(body) < length:
+                chunk = s.recv(BUFFER_SIZE)
+                if not chunk:
+                    break
+                body += chunk
+            if is_chunked(header_str):
+                body = decode_chunked(body)  # Large listings are streamed in chunks
             print(body.decode("utf-8", errors="ignore"))
             return
         if content_type in ["application/pdf", "image/png"]:
@@ -30,21 +73,343 @@ def http_get(host, port, filename, save_dir):
             filename_local = filename.strip("/").split("/")[-1] or "index.html"
             file_path = os.path.join(save_dir, filename_local)
             with open(file_path, "wb") as f:
-                f.write(rest) 
+                f.write(rest)
                 while True:
-                    data = s.recv(BUFFER_SIZE) 
+                    data = s.recv(BUFFER_SIZE)
                     if not data:
-                        break 
+                        break
                     f.write(data)
-            print(f"Saved {content_type} file to {file_path}") 
+            print(f"Saved {content_type} file to {file_path}")
         else:
             print(f"Unsupported or missing content type: {content_type}")
+
+
+class KeepAliveConnection:
+    """One persistent HTTP/1.1 connection, reopened when the server closes it.
+
+    The server closes idle connections and those that reached their
+    request limit; a request that fails on a reused connection before any
+    response arrived is retried once on a fresh one.
+    """
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = int(port)
+        self.sock = None
+        self.rfile = None
+        self.requests = 0
+        self.opened = 0
+
+    def connect(self):
+        self.sock = socket.create_connection((self.host, self.port), timeout=30)
+        self.rfile = self.sock.makefile("rb", MIRROR_CHUNK_SIZE)
+        self.opened += 1
+
+    def close(self):
+        if self.sock is not None:
+            self.rfile.close()
+            self.sock.close()
+            self.sock = self.rfile = None
+
+    def request(self, path, headers=None):
+        """Send a GET and read the response head. Returns (status, headers); the body is read with read_body()."""
+        lines = [f"GET {path} HTTP/1.1", f"Host: {self.host}"]
+        lines += [f"{name}: {value}" for name, value in (headers or {}).items()]
+        data = ("\r\n".join(lines) + "\r\n\r\n").encode("utf-8")
+        for attempt in range(2):
+            reused = self.sock is not None
+            if not reused:
+                self.connect()
+            try:
+                self.sock.sendall(data)
+                status_line = self.rfile.readline()
+                if not status_line:
+                    raise ConnectionError("Connection closed by server")
+            except OSError:
+                self.close()
+                if reused and attempt == 0:
+                    continue
+                raise
+            break
+        self.requests += 1
+
+        status = int(status_line.split()[1])
+        response_headers = {}
+        while True:
+            line = self.rfile.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode("iso-8859-1").partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+        return status, response_headers
+
+    def read_body(self, status, headers, out=None):
+        """Read the body, chunked or announced by Content-Length; written to `out` if given, else returned.
+
+        Raises ConnectionError if the connection ends early, leaving what
+        was received in `out`.
+        """
+        body = []
+        if status in (204, 304) or 100 <= status < 200:
+            remaining = 0
+        elif "chunked" in headers.get("transfer-encoding", "").lower():
+            self.read_chunks(out.write if out is not None else body.append)
+            remaining = 0
+        elif "content-length" in headers:
+            remaining = int(headers["content-length"])
+        else:
+            remaining = None  # Delimited by the server closing the connection
+        while remaining is None or remaining > 0:
+            chunk = self.rfile.read1(MIRROR_CHUNK_SIZE if remaining is None else min(remaining, MIRROR_CHUNK_SIZE))
+            if not chunk:
+                if remaining is None:
+                    break
+                self.close()
+                raise ConnectionError(f"Connection closed with {remaining} body bytes missing")
+            if out is not None:
+                out.write(chunk)
+            else:
+                body.append(chunk)
+            if remaining is not None:
+                remaining -= len(chunk)
+        if remaining is None or headers.get("connection", "").lower() == "close":
+            self.close()
+        return b"".join(body)
+
+
+    def read_chunks(self, write):
+        """Decode a chunked body, passing the data to `write`; trailer fields are dropped."""
+        while True:
+            size_line = self.rfile.readline()
+            if not size_line:
+                self.close()
+                raise ConnectionError("Connection closed inside a chunked body")
+            size = int(size_line.split(b";")[0].strip(), 16)
+            if size == 0:
+                break
+            remaining = size
+            while remaining > 0:
+                chunk = self.rfile.read1(min(remaining, MIRROR_CHUNK_SIZE))
+                if not chunk:
+                    self.close()
+                    raise ConnectionError(f"Connection closed with {remaining} chunk bytes missing")
+                write(chunk)
+                remaining -= len(chunk)
+            self.rfile.readline()  # CRLF ending the chunk data
+        while self.rfile.readline() not in (b"\r\n", b"\n", b""):
+            pass
+
+
+class LinkParser(HTMLParser):
+    """Collects the href of every <a> in a directory listing."""
+
+    def __init__(self):
+        super().__init__()
+        self.links = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "a":
+            for name, value in attrs:
+                if name == "href" and value:
+                    self.links.append(value)
+
+
+def parse_http_date(value):
+    try:
+        return email.utils.parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+
+
+class Mirror:
+    """Recursive, parallel copy of a served directory tree into `save_dir`.
+
+    Directory listings are crawled for links below `root`; every file
+    found is downloaded by one of `connections` threads, each reusing its
+    own keep-alive connection. Bodies are streamed to `<file>.part` and
+    renamed into place once Content-Length bytes have arrived, and the
+    file's mtime is set from Last-Modified. Files are then skipped with
+    an If-Modified-Since request answered 304, and an interrupted
+    download is resumed with Range + If-Range (the ETag is kept next to
+    the partial file), falling back to a full download when the file
+    changed on the server.
+    """
+
+    def __init__(self, host, port, root, save_dir, connections=MIRROR_CONNECTIONS):
+        self.host = host
+        self.port = port
+        self.root = root if root.endswith("/") else root + "/"
+        self.save_dir = save_dir
+        self.connections = connections
+        self.work = queue.Queue()
+        self.seen = set()
+        self.lock = threading.Lock()
+        self.counts = {"listings": 0, "downloaded": 0, "resumed": 0, "up_to_date": 0, "failed": 0}
+        self.bytes_received = 0
+        self.requests = 0
+        self.opened = 0
+
+    def count(self, key, nbytes=0):
+        with self.lock:
+            self.counts[key] += 1
+            self.bytes_received += nbytes
+
+    def enqueue(self, path):
+        with self.lock:
+            if path in self.seen:
+                return
+            self.seen.add(path)
+        self.work.put(path)
+
+    def local_path(self, path):
+        relative = urllib.parse.unquote(path[len(self.root):])
+        return os.path.join(self.save_dir, *[part for part in relative.split("/") if part not in ("", ".", "..")])
+
+    def fetch(self, conn, path, headers=None):
+        """Request `path`, waiting and retrying while the server answers 429 or 503."""
+        for attempt in range(MIRROR_RETRIES):
+            status, response_headers = conn.request(path, headers)
+            if status not in (429, 503):
+                return status, response_headers
+            conn.read_body(status, response_headers)
+            try:
+                delay = float(response_headers.get("retry-after", 1))
+            except ValueError:
+                delay = 1.0
+            time.sleep(min(delay, 10) * (attempt + 1) / 2)
+        return status, response_headers
+
+    def crawl(self, conn, path):
+        status, headers = self.fetch(conn, path)
+        body = conn.read_body(status, headers)
+        if status != 200:
+            print(f"[{status}] {path}")
+            self.count("failed")
+            return
+        self.count("listings", len(body))
+        parser = LinkParser()
+        parser.feed(body.decode("utf-8", errors="replace"))
+        for link in parser.links:
+            target = urllib.parse.urlsplit(urllib.parse.urljoin(path, link))
+            if target.netloc or not target.path.startswith(self.root) or target.path == path:
+                continue  # Parent directory, or another site
+            self.enqueue(target.path)
+
+    def download(self, conn, path):
+        file_path = self.local_path(path)
+        partial_path = file_path + PARTIAL_SUFFIX
+        validator_path = file_path + VALIDATOR_SUFFIX
+        headers = {}
+        offset = os.path.getsize(partial_path) if os.path.exists(partial_path) else 0
+        etag = None
+        if offset and os.path.exists(validator_path):
+            with open(validator_path) as f:
+                etag = f.read().strip()
+        if offset and etag:
+            headers["Range"] = f"bytes={offset}-"
+            headers["If-Range"] = etag
+        elif os.path.exists(file_path):
+            headers["If-Modified-Since"] = email.utils.formatdate(os.path.getmtime(file_path), usegmt=True)
+
+        status, response_headers = self.fetch(conn, path, headers)
+        if status == 304:
+            self.count("up_to_date")
+            return
+        if status == 416:
+            # The partial file is not a prefix of the current one: start over
+            conn.read_body(status, response_headers)
+            os.remove(partial_path)
+            status, response_headers = self.fetch(conn, path)
+        if status not in (200, 206):
+            conn.read_body(status, response_headers)
+            print(f"[{status}] {path}")
+            self.count("failed")
+            return
+
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        resumed = status == 206
+        if not resumed and "etag" in response_headers:
+            with open(validator_path, "w") as f:
+                f.write(response_headers["etag"])
+        with open(partial_path, "ab" if resumed else "wb") as out:
+            start = out.tell()
+            try:
+                conn.read_body(status, response_headers, out)
+            finally:
+                received = out.tell() - start
+        os.replace(partial_path, file_path)
+        if os.path.exists(validator_path):
+            os.remove(validator_path)
+        modified = parse_http_date(response_headers.get("last-modified", ""))
+        if modified is not None:
+            os.utime(file_path, (modified, modified))
+        self.count("resumed" if resumed else "downloaded", received)
+
+    def worker(self):
+        conn = KeepAliveConnection(self.host, self.port)
+        try:
+            while True:
+                path = self.work.get()
+                if path is None:
+                    return
+                try:
+                    if path.endswith("/"):
+                        self.crawl(conn, path)
+                    else:
+                        self.download(conn, path)
+                except (OSError, ValueError) as e:
+                    print(f"[error] {path}: {e}")
+                    conn.close()
+                    self.count("failed")
+                finally:
+                    self.work.task_done()
+        finally:
+            conn.close()
+            with self.lock:
+                self.requests += conn.requests
+                self.opened += conn.opened
+
+    def run(self):
+        started = time.perf_counter()
+        threads = [threading.Thread(target=self.worker, daemon=True) for _ in range(self.connections)]
+        for thread in threads:
+            thread.start()
+        self.enqueue(self.root)
+        self.work.join()
+        for _ in threads:
+            self.work.put(None)
+        for thread in threads:
+            thread.join()
+        elapsed = time.perf_counter() - started
+        counts = self.counts
+        print(f"Mirrored {self.root} into {self.save_dir} in {elapsed:.2f}s: "
+              f"{counts['downloaded']} downloaded, {counts['resumed']} resumed, {counts['up_to_date']} up to date, "
+              f"{counts['failed']} failed, {counts['listings']} listings")
+        print(f"{self.bytes_received / 1024:.1f} KiB received in {self.requests} requests "
+              f"over {self.opened} connections")
+        return counts["failed"] == 0
+
+
+def get_option_value(name, default, cast=int):
+    """Return the value that follows a CLI option such as '--connections 8'."""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return cast(sys.argv[index + 1])
+    return default
+
+
 if __name__ == "__main__":
-    if len(sys.argv) != 5:
+    args = [arg for arg in sys.argv[1:] if arg != "--mirror"]
+    if "--connections" in args:
+        index = args.index("--connections")
+        del args[index:index + 2]
+    if len(args) != 4:
         print("Usage: python client.py <server_host> <server_port> <filename> <save_directory>")
+        print("       python client.py <server_host> <server_port> <directory> <save_directory> --mirror [--connections N]")
         sys.exit(1)
-    host = sys.argv[1]
-    port = sys.argv[2]
-    filename = sys.argv[3]
-    save_dir = sys.argv[4]
+    host, port, filename, save_dir = args
+    if "--mirror" in sys.argv:
+        mirror = Mirror(host, port, filename, save_dir, get_option_value("--connections", MIRROR_CONNECTIONS))
+        sys.exit(0 if mirror.run() else 1)
     http_get(host, port, filename, save_dir)
@@ -0,0 +1,118 @@
+import threading
+from collections import OrderedDict, namedtuple
+
+# One cached file: the stat fields it was built from plus the response pieces
+CacheEntry = namedtuple("CacheEntry", ["mtime_ns", "size", "head", "body", "content_type"])
+
+
+class ContentCache:
+    """Thread-safe LRU cache of pre-built file responses, bounded by total bytes.
+
+    Entries are keyed by normalized file path and validated against the
+    file's current mtime and size on every lookup, so an edited file is
+    never served stale.
+    """
+
+    def __init__(self, max_bytes, max_entry_bytes):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def cacheable(self, size):
+        """Whether a file of `size` bytes is small enough to be cached."""
+        return 0 < size <= self.max_entry_bytes and self.max_bytes > 0
+
+    def get(self, path, stat_result):
+        """Return the entry for `path` if it still matches `stat_result`, else None."""
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry is None:
+                self.misses += 1
+                return None
+            if entry.mtime_ns != stat_result.st_mtime_ns or entry.size != stat_result.st_size:
+                self._remove(path)
+                self.invalidations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(path)
+            self.hits += 1
+            return entry
+
+    def put(self, path, stat_result, head, body, content_type):
+        """Store a response built from a file whose stat was `stat_result`."""
+        entry = CacheEntry(stat_result.st_mtime_ns, stat_result.st_size, head, body, content_type)
+        cost = len(head) + len(body)
+        if cost > self.max_bytes:
+            return
+        with self._lock:
+            if path in self._entries:
+                self._remove(path)
+            self._entries[path] = entry
+            self._bytes += cost
+            while self._bytes > self.max_bytes:
+                oldest = next(iter(self._entries))
+                self._remove(oldest)
+                self.evictions += 1
+
+    def _remove(self, path):
+        entry = self._entries.pop(path)
+        self._bytes -= len(entry.head) + len(entry.body)
+
+    def stats(self):
+        """Snapshot of the cache counters, for sizing the byte budget."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+
+class ListingCache:
+    """Thread-safe cache of pre-rendered directory listing templates.
+
+    Each entry is tagged with the directory's mtime at scan time; adding,
+    removing or renaming an entry changes the mtime and forces a rescan.
+    The number of cached listings is bounded with LRU eviction.
+    """
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, mtime_ns):
+        """Return the template stored for `key` if the directory is unchanged, else None."""
+        with self._lock:
+            cached = self._entries.get(key)
+            if cached is None or cached[0] != mtime_ns:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return cached[1]
+
+    def put(self, key, mtime_ns, template):
+        with self._lock:
+            self._entries[key] = (mtime_ns, template)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def stats(self):
+        with self._lock:
+            return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
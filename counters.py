@@ -0,0 +1,79 @@
+import itertools
+import threading
+import time
+
+
+class ShardedCounter:
+    """Exact per-key counters split across lock-striped shards.
+
+    Each thread is pinned to one shard the first time it counts, so workers
+    only contend with the few threads sharing their stripe instead of with
+    every other worker. Every key has one cell, a list with a slot per
+    shard; a shard's lock guards that shard's slot in every cell. A
+    snapshot takes every shard lock once, in order, and sums each key's
+    cell, so a listing costs one dict lookup and one sum per entry and
+    sees all its counts as of one instant.
+    """
+
+    def __init__(self, num_shards=8):
+        self._num_shards = num_shards
+        self._cells = {}
+        self._locks = [threading.Lock() for _ in range(num_shards)]
+        self._next_shard = itertools.count()
+        self._local = threading.local()
+
+    def _assign_shard(self):
+        index = self._local.index = next(self._next_shard) % self._num_shards
+        return index
+
+    def _cell(self, key):
+        cell = self._cells.get(key)
+        if cell is None:
+            # setdefault is atomic: racing first increments agree on one cell
+            cell = self._cells.setdefault(key, [0] * self._num_shards)
+        return cell
+
+    def increment(self, key, amount=1):
+        try:
+            index = self._local.index
+        except AttributeError:
+            index = self._assign_shard()
+        cell = self._cell(key)
+        with self._locks[index]:
+            cell[index] += amount
+
+    def increment_racy(self, key):
+        """Unsynchronized read-modify-write on one shared slot; loses updates under concurrency.
+
+        Only used by --no-lock to demonstrate the race condition.
+        """
+        cell = self._cell(key)
+        current = cell[0]
+        time.sleep(0.001)  # Delay to force interleaving
+        cell[0] = current + 1
+
+    def get(self, key):
+        return self.snapshot([key])[0]
+
+    def snapshot(self, keys):
+        """Current totals for `keys`, in order, all as of one instant.
+
+        Writers hold one shard lock and readers all of them, always taken
+        in index order, so no increment is half-seen and there is no
+        deadlock.
+        """
+        for lock in self._locks:
+            lock.acquire()
+        try:
+            return list(map(sum, map(self._cells.get, keys, itertools.repeat(()))))
+        finally:
+            for lock in self._locks:
+                lock.release()
+
+    def items(self):
+        """Merged (key, total) pairs for every key counted so far, as of one instant."""
+        keys = list(self._cells)
+        return dict(zip(keys, self.snapshot(keys))).items()
+
+    def __getitem__(self, key):
+        return self.get(key)
@@ -0,0 +1,236 @@
+import heapq
+import itertools
+import queue
+import selectors
+import socket
+import time
+
+from http_parser import BadRequest
+
+# How often idle and slow connections are checked against their deadlines
+DEADLINE_CHECK_INTERVAL = 0.25
+
+
+class Connection:
+    """Front-end state for one client socket."""
+
+    __slots__ = ("sock", "addr", "parser", "served", "deadline")
+
+    def __init__(self, sock, addr, parser, deadline):
+        self.sock = sock
+        self.addr = addr
+        self.parser = parser  # Holds received bytes not yet consumed, including pipelined requests
+        self.served = 0
+        self.deadline = deadline
+
+
+class SelectorFrontEnd:
+    """Event-driven accept and header-read loop in front of a worker pool.
+
+    One thread multiplexes every open connection with `selectors`. Worker
+    threads only ever see fully received requests, so idle or slow clients
+    cost a few bytes of state instead of a blocked worker. After a
+    keep-alive response the worker hands the connection back to this loop.
+    `executor` is an admission.AdmissionControl: when its pending queue is
+    full the request is refused with `overloaded_response` (a 503).
+
+    Phases and their timeouts:
+      header read  -- from the first byte (or accept) until the request is complete
+      idle         -- between keep-alive requests
+      body send    -- socket timeout while a worker writes the response
+    """
+
+    def __init__(self, server_socket, executor, new_parser, handler, error_response, overloaded_response,
+                 header_timeout, idle_timeout, send_timeout, delay=0.0, metrics=None, log_access=None):
+        self.server_socket = server_socket
+        self.executor = executor
+        self.new_parser = new_parser
+        self.handler = handler
+        self.error_response = error_response
+        self.overloaded_response = overloaded_response
+        self.header_timeout = header_timeout
+        self.idle_timeout = idle_timeout
+        self.send_timeout = send_timeout
+        self.delay = delay
+        self.metrics = metrics  # Optional ServerMetrics; told about connections opening and closing
+        self.log_access = log_access  # Optional log_access(client_ip, request, status, nbytes) for responses sent here
+        self._selector = selectors.DefaultSelector()
+        self._wakeup_reader, self._wakeup_writer = socket.socketpair()
+        self._returned = queue.SimpleQueue()
+        self._waiting = set()  # Connections registered with the selector
+        self._delayed = []  # Heap of (due, sequence, connection, request) for --delay
+        self._sequence = itertools.count()
+        self._next_deadline_check = 0.0
+
+    def serve_forever(self):
+        self.server_socket.setblocking(False)
+        self._wakeup_reader.setblocking(False)
+        self._wakeup_writer.setblocking(False)
+        self._selector.register(self.server_socket, selectors.EVENT_READ, self._accept)
+        self._selector.register(self._wakeup_reader, selectors.EVENT_READ, self._drain_returned)
+
+        while True:
+            timeout = DEADLINE_CHECK_INTERVAL
+            if self._delayed:
+                timeout = max(0.0, min(timeout, self._delayed[0][0] - time.monotonic()))
+            for key, _ in self._selector.select(timeout):
+                if isinstance(key.data, Connection):
+                    self._read(key.data)
+                else:
+                    key.data()
+
+            now = time.monotonic()
+            while self._delayed and self._delayed[0][0] <= now:
+                _, _, connection, request = heapq.heappop(self._delayed)
+                self._submit(connection, request)
+            if now >= self._next_deadline_check:
+                self._expire(now)
+                self._next_deadline_check = now + DEADLINE_CHECK_INTERVAL
+
+    def _accept(self):
+        while True:
+            try:
+                sock, addr = self.server_socket.accept()
+            except (BlockingIOError, InterruptedError):
+                return
+            except OSError as e:
+                print("Error accepting connection:", e)
+                return
+            sock.setblocking(False)
+            if self.metrics is not None:
+                self.metrics.connection_opened()
+            self._wait(Connection(sock, addr, self.new_parser(), time.monotonic() + self.header_timeout))
+
+    def _wait(self, connection):
+        self._selector.register(connection.sock, selectors.EVENT_READ, connection)
+        self._waiting.add(connection)
+
+    def _unwait(self, connection):
+        self._selector.unregister(connection.sock)
+        self._waiting.discard(connection)
+
+    def _close(self, connection):
+        try:
+            connection.sock.close()
+        except OSError:
+            pass
+        if self.metrics is not None:
+            self.metrics.connection_closed()
+
+    def _read(self, connection):
+        try:
+            chunk = connection.sock.recv(65536)
+        except (BlockingIOError, InterruptedError):
+            return
+        except OSError:
+            chunk = b""
+        if not chunk:
+            self._unwait(connection)
+            self._close(connection)
+            return
+
+        if not connection.parser.pending():
+            # First byte of a new request: the idle phase ends, the header phase starts
+            connection.deadline = time.monotonic() + self.header_timeout
+        connection.parser.feed(chunk)
+        self._try_dispatch(connection, registered=True)
+
+    def _try_dispatch(self, connection, registered):
+        """Hand the connection to a worker if its parser holds a complete request."""
+        try:
+            request = connection.parser.next_request()
+        except BadRequest as e:
+            if registered:
+                self._unwait(connection)
+            response = self.error_response(e)
+            try:
+                sent = connection.sock.send(response)
+            except OSError:
+                sent = 0
+            if self.metrics is not None:
+                self.metrics.record_response(int(response[9:12]), len(response))
+            if self.log_access is not None:
+                self.log_access(connection.addr[0], None, int(response[9:12]), sent)
+            self._close(connection)
+            return
+        except Exception as e:
+            # A parser bug must cost this connection, not the loop serving all of them
+            print(f"Error parsing request from {connection.addr[0]}:", e)
+            if registered:
+                self._unwait(connection)
+            self._close(connection)
+            return
+
+        if request is None:
+            if not registered:
+                self._wait(connection)
+            return
+
+        if registered:
+            self._unwait(connection)
+        if self.delay > 0:
+            # Simulated work waits here instead of holding a worker thread
+            heapq.heappush(self._delayed, (time.monotonic() + self.delay, next(self._sequence), connection, request))
+        else:
+            self._submit(connection, request)
+
+    def _submit(self, connection, request):
+        """Queue the request for a worker, or refuse it at once if the pending queue is full."""
+        if self.executor.try_submit(self._serve, connection, request):
+            return
+        try:
+            sent = connection.sock.send(self.overloaded_response)
+        except OSError:
+            sent = 0
+        if self.metrics is not None:
+            self.metrics.record_response(503, len(self.overloaded_response))
+        if self.log_access is not None:
+            self.log_access(connection.addr[0], request, 503, sent)
+        self._close(connection)
+
+    def _serve(self, connection, request):
+        """Runs in a worker thread: answer one request, then return or close the connection."""
+        keep_alive = False
+        try:
+            connection.sock.settimeout(self.send_timeout)
+            connection.served += 1
+            keep_alive = self.handler(connection.sock, connection.addr, request, connection.served)
+        except socket.timeout:
+            pass  # Client stopped reading the response
+        except Exception as e:
+            print(f"Error handling request from {connection.addr[0]}:", e)
+
+        if not keep_alive:
+            self._close(connection)
+            return
+        connection.sock.setblocking(False)
+        self._returned.put(connection)
+        try:
+            self._wakeup_writer.send(b"\0")
+        except (BlockingIOError, InterruptedError):
+            pass  # A wakeup is already pending
+
+    def _drain_returned(self):
+        try:
+            while self._wakeup_reader.recv(4096):
+                pass
+        except (BlockingIOError, InterruptedError):
+            pass
+        now = time.monotonic()
+        while True:
+            try:
+                connection = self._returned.get_nowait()
+            except queue.Empty:
+                return
+            if connection.parser.pending():
+                connection.deadline = now + self.header_timeout
+            else:
+                connection.deadline = now + self.idle_timeout
+            # A pipelined request may already be waiting in the buffer
+            self._try_dispatch(connection, registered=False)
+
+    def _expire(self, now):
+        expired = [connection for connection in self._waiting if connection.deadline <= now]
+        for connection in expired:
+            self._unwait(connection)
+            self._close(connection)
@@ -0,0 +1,118 @@
+import re
+import time
+from collections import namedtuple
+
+# Parsed request head; headers are keyed by lower-case name
+Request = namedtuple("Request", ["method", "path", "version", "headers"])
+
+# RFC 9110 token characters, which a method must consist of
+TOKEN = re.compile(r"[!#$%&'*+.^_`|~0-9A-Za-z-]+")
+
+
+class BadRequest(Exception):
+    """Raised when a request head cannot be parsed; `status` is the response to send."""
+
+    status = "400 Bad Request"
+
+
+class HeaderTooLarge(BadRequest):
+    """Raised when the request head exceeds the size or header-count limit."""
+
+    status = "431 Request Header Fields Too Large"
+
+
+class RequestParser:
+    """Incremental HTTP/1.x request parser for one connection.
+
+    Received bytes are appended to one bytearray with feed(); next_request()
+    returns each complete request in turn, or None while more bytes are
+    needed. The search for the end of the head resumes where the previous
+    call stopped, so a head arriving in many small reads is scanned once.
+    A complete head is decoded once and validated while it is split into
+    headers; consumed bytes are dropped from the front of the bytearray
+    instead of copying the rest of the buffer for every request.
+
+    Request bodies are not used by the server; they are discarded as they
+    arrive instead of being buffered.
+    """
+
+    def __init__(self, max_header_size=8192, max_headers=100, on_parse=None):
+        self.max_header_size = max_header_size
+        self.max_headers = max_headers
+        self.on_parse = on_parse  # Called with the nanoseconds spent parsing each request
+        self._buffer = bytearray()
+        self._scan_from = 0
+        self._skip = 0  # Body bytes of the previous request still to discard
+
+    def feed(self, data):
+        if self._skip:
+            if len(data) <= self._skip:
+                self._skip -= len(data)
+                return
+            data = memoryview(data)[self._skip:]
+            self._skip = 0
+        self._buffer += data
+
+    def pending(self):
+        """Whether buffered bytes of a next request are waiting."""
+        return bool(self._buffer)
+
+    def next_request(self):
+        """Parse the next complete request head. Raises BadRequest or HeaderTooLarge."""
+        buffer = self._buffer
+        end = buffer.find(b"\r\n\r\n", self._scan_from)
+        if end < 0:
+            if len(buffer) > self.max_header_size:
+                raise HeaderTooLarge("Request head too large")
+            # The terminator may straddle the next read
+            self._scan_from = max(0, len(buffer) - 3)
+            return None
+        if end + 4 > self.max_header_size:
+            raise HeaderTooLarge("Request head too large")
+
+        started = time.perf_counter_ns() if self.on_parse is not None else 0
+        lines = buffer[:end].decode("iso-8859-1").split("\r\n")
+        if len(lines) - 1 > self.max_headers:
+            raise HeaderTooLarge("Too many header lines")
+        try:
+            method, target, version = lines[0].split(" ")
+        except ValueError:
+            raise BadRequest(f"Malformed request line: {lines[0][:80]!r}")
+        if not TOKEN.fullmatch(method) or not target or not version.startswith("HTTP/1."):
+            raise BadRequest(f"Malformed request line: {lines[0][:80]!r}")
+
+        # One pass validates and splits the header lines
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            # Whitespace around a name means obsolete line folding or "Name :", both rejected
+            if not sep or not name or name != name.strip():
+                raise BadRequest(f"Malformed header line: {line[:80]!r}")
+            headers[name.lower()] = value.strip()
+        request = Request(method, target, version, headers)
+
+        consumed = end + 4
+        if "content-length" in headers or "transfer-encoding" in headers:
+            consumed += request_body_length(headers)
+        if consumed > len(buffer):
+            self._skip = consumed - len(buffer)
+            consumed = len(buffer)
+        del buffer[:consumed]
+        self._scan_from = 0
+        if self.on_parse is not None:
+            self.on_parse(time.perf_counter_ns() - started)
+        return request
+
+
+def request_body_length(headers):
+    """Number of body bytes that follow the head and must be consumed before the next request."""
+    if "transfer-encoding" in headers:
+        # Chunked request bodies are not supported; guessing the framing would desync the connection
+        raise BadRequest("Transfer-Encoding in requests is not supported")
+    try:
+        length = int(headers.get("content-length", 0))
+    except ValueError:
+        raise BadRequest("Invalid Content-Length")
+    if length < 0:
+        raise BadRequest("Invalid Content-Length")
+    return length
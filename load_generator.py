@@ -0,0 +1,327 @@
+import asyncio
+import json
+import math
+import random
+import time
+import urllib.parse
+
+PERCENTILES = (50, 90, 99, 99.9)
+
+
+class LatencyHistogram:
+    """Log-bucketed latency histogram: constant memory, about 1% relative error per bucket."""
+
+    def __init__(self, precision=0.01):
+        self._log_base = math.log1p(precision)
+        self._buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = 0.0
+
+    def record(self, seconds):
+        micros = max(seconds * 1e6, 1.0)
+        index = int(math.log(micros) / self._log_base)
+        self._buckets[index] = self._buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+
+    def merge(self, other):
+        for index, count in other._buckets.items():
+            self._buckets[index] = self._buckets.get(index, 0) + count
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def percentile(self, percent):
+        """Latency in seconds below which `percent` of samples fall (bucket upper bound)."""
+        if not self.count:
+            return math.nan
+        rank = math.ceil(self.count * percent / 100.0)
+        seen = 0
+        for index in sorted(self._buckets):
+            seen += self._buckets[index]
+            if seen >= rank:
+                return min(math.exp((index + 1) * self._log_base) / 1e6, self.max)
+        return self.max
+
+    def summary(self):
+        """Latencies in milliseconds."""
+        if not self.count:
+            return {"count": 0}
+        result = {
+            "count": self.count,
+            "mean_ms": round(self.total / self.count * 1000, 3),
+            "min_ms": round(self.min * 1000, 3),
+            "max_ms": round(self.max * 1000, 3),
+        }
+        for percent in PERCENTILES:
+            result[f"p{percent}_ms"] = round(self.percentile(percent) * 1000, 3)
+        return result
+
+
+class LoadResult:
+    """Everything measured during one run against one target."""
+
+    def __init__(self):
+        self.latency = LatencyHistogram()
+        self.per_path = {}
+        self.statuses = {}
+        self.errors = 0
+        self.dropped = 0  # Open loop only: arrivals skipped because max in-flight was reached
+        self.bytes_received = 0
+        self.elapsed = 0.0
+
+    def record(self, path, status, nbytes, seconds):
+        self.latency.record(seconds)
+        self.per_path.setdefault(path, LatencyHistogram()).record(seconds)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.bytes_received += nbytes
+
+    def summary(self):
+        completed = self.latency.count
+        return {
+            "completed": completed,
+            "errors": self.errors,
+            "dropped": self.dropped,
+            "elapsed_s": round(self.elapsed, 3),
+            "throughput_rps": round(completed / self.elapsed, 2) if self.elapsed else 0.0,
+            "bytes_received": self.bytes_received,
+            "statuses": {str(status): count for status, count in sorted(self.statuses.items())},
+            "latency": self.latency.summary(),
+            "per_path": {path: histogram.summary() for path, histogram in sorted(self.per_path.items())},
+        }
+
+
+def parse_target(url):
+    """Split a base URL such as http://host:8080 into (host, port, default_path)."""
+    parts = urllib.parse.urlsplit(url if "://" in url else f"http://{url}")
+    return parts.hostname or "localhost", parts.port or 80, parts.path or "/"
+
+
+def parse_mix(spec, default_path="/"):
+    """Parse a URL mix like '/=3,/subdir/1.pdf=1' into (paths, weights)."""
+    if not spec:
+        return [default_path], [1]
+    paths, weights = [], []
+    for item in spec.split(","):
+        path, _, weight = item.strip().partition("=")
+        paths.append(path)
+        weights.append(float(weight) if weight else 1.0)
+    return paths, weights
+
+
+class HttpConnection:
+    """Minimal HTTP/1.1 client connection over asyncio streams."""
+
+    def __init__(self, host, port, keep_alive):
+        self.host = host
+        self.port = port
+        self.keep_alive = keep_alive
+        self._reader = None
+        self._writer = None
+
+    async def request(self, path, timeout):
+        """Issue a GET and read the whole response. Returns (status, body_bytes)."""
+        return await asyncio.wait_for(self._request(path), timeout)
+
+    async def _request(self, path):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        connection = "keep-alive" if self.keep_alive else "close"
+        self._writer.write(f"GET {path} HTTP/1.1\r\nHost: {self.host}\r\nConnection: {connection}\r\n\r\n".encode())
+        await self._writer.drain()
+
+        head = await self._reader.readuntil(b"\r\n\r\n")
+        lines = head.decode("iso-8859-1").split("\r\n")
+        status = int(lines[0].split()[1])
+        headers = {}
+        for line in lines[1:]:
+            name, sep, value = line.partition(":")
+            if sep:
+                headers[name.strip().lower()] = value.strip()
+
+        if status in (204, 304):
+            nbytes = 0  # Never carry a body, whatever the headers say
+        elif "content-length" in headers:
+            nbytes = len(await self._reader.readexactly(int(headers["content-length"])))
+        elif headers.get("transfer-encoding", "").lower() == "chunked":
+            nbytes = await self._read_chunked()
+        else:
+            nbytes = len(await self._reader.read())
+            headers["connection"] = "close"
+
+        if not self.keep_alive or headers.get("connection", "").lower() == "close":
+            self.close()
+        return status, nbytes
+
+    async def _read_chunked(self):
+        nbytes = 0
+        while True:
+            size = int((await self._reader.readuntil(b"\r\n")).split(b";")[0], 16)
+            if size == 0:
+                await self._reader.readuntil(b"\r\n")  # Final CRLF (no trailers expected)
+                return nbytes
+            nbytes += len(await self._reader.readexactly(size))
+            await self._reader.readexactly(2)
+
+    def close(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+async def run_closed_loop(url, concurrency, duration, mix=None, keep_alive=False, timeout=10.0, seed=None):
+    """Fixed concurrency: each of `concurrency` clients sends its next request when the last one completes."""
+    host, port, default_path = parse_target(url)
+    paths, weights = parse_mix(mix, default_path)
+    rng = random.Random(seed)
+    result = LoadResult()
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        connection = HttpConnection(host, port, keep_alive)
+        while time.perf_counter() < deadline:
+            path = rng.choices(paths, weights)[0]
+            start = time.perf_counter()
+            try:
+                status, nbytes = await connection.request(path, timeout)
+            except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+                result.errors += 1
+                connection.close()
+                continue
+            result.record(path, status, nbytes, time.perf_counter() - start)
+        connection.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+async def run_open_loop(url, rate, duration, mix=None, keep_alive=False, timeout=10.0, max_inflight=1000, seed=None):
+    """Fixed arrival rate: requests start on schedule whether or not earlier ones have finished.
+
+    Latency is measured from the scheduled start time, so a stalled server
+    is not hidden by the client waiting for it (coordinated omission).
+    """
+    host, port, default_path = parse_target(url)
+    paths, weights = parse_mix(mix, default_path)
+    rng = random.Random(seed)
+    result = LoadResult()
+    idle_connections = []
+    inflight = set()
+
+    async def one(path, scheduled):
+        connection = idle_connections.pop() if idle_connections else HttpConnection(host, port, keep_alive)
+        try:
+            status, nbytes = await connection.request(path, timeout)
+        except (OSError, asyncio.TimeoutError, asyncio.IncompleteReadError, ValueError):
+            result.errors += 1
+            connection.close()
+            return
+        result.record(path, status, nbytes, time.perf_counter() - scheduled)
+        if keep_alive and connection._writer is not None:
+            idle_connections.append(connection)
+
+    start = time.perf_counter()
+    total = int(rate * duration)
+    for n in range(total):
+        scheduled = start + n / rate
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        if len(inflight) >= max_inflight:
+            result.dropped += 1
+            continue
+        task = asyncio.ensure_future(one(rng.choices(paths, weights)[0], scheduled))
+        inflight.add(task)
+        task.add_done_callback(inflight.discard)
+    if inflight:
+        await asyncio.wait(inflight)
+    result.elapsed = time.perf_counter() - start
+    for connection in idle_connections:
+        connection.close()
+    return result
+
+
+def run_load(url, mode="closed", concurrency=50, rate=100.0, duration=10.0, mix=None, keep_alive=False,
+             timeout=10.0, max_inflight=1000, seed=None):
+    """Synchronous entry point used by the test and benchmark scripts."""
+    if mode == "open":
+        coroutine = run_open_loop(url, rate, duration, mix, keep_alive, timeout, max_inflight, seed)
+    else:
+        coroutine = run_closed_loop(url, concurrency, duration, mix, keep_alive, timeout, seed)
+    return asyncio.run(coroutine)
+
+
+def print_comparison(rows):
+    """Print one line per (label, summary) pair."""
+    print(f"{'target':<28}{'ok':>8}{'err':>6}{'req/s':>10}{'p50 ms':>9}{'p90 ms':>9}{'p99 ms':>9}{'p99.9 ms':>10}{'max ms':>9}")
+    for label, summary in rows:
+        latency = summary["latency"]
+        if not latency["count"]:
+            print(f"{label:<28}{0:>8}{summary['errors']:>6}{0:>10.1f}")
+            continue
+        print(f"{label:<28}{summary['completed']:>8}{summary['errors']:>6}{summary['throughput_rps']:>10.1f}"
+              f"{latency['p50_ms']:>9.2f}{latency['p90_ms']:>9.2f}{latency['p99_ms']:>9.2f}"
+              f"{latency['p99.9_ms']:>10.2f}{latency['max_ms']:>9.2f}")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Asyncio HTTP load generator",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        epilog="""
+Examples:
+  # Closed loop: 50 concurrent clients for 10 s
+  python load_generator.py http://localhost:8080 --concurrency 50 --duration 10
+
+  # Open loop: 200 requests/second, mixed URLs, keep-alive connections
+  python load_generator.py http://localhost:8080 --mode open --rate 200 --mix "/=3,/subdir/1.pdf=1" --keep-alive
+
+  # Compare the docker-compose variants and save the results
+  python load_generator.py http://localhost:8080 http://localhost:8081 http://localhost:8082 http://localhost:8083 --json results.json
+        """
+    )
+    parser.add_argument("targets", nargs="+", help="Base URLs to test, run one after another")
+    parser.add_argument("--mode", choices=["closed", "open"], default="closed",
+                        help="closed: fixed concurrency; open: fixed arrival rate (default: closed)")
+    parser.add_argument("--concurrency", type=int, default=50, help="Concurrent clients in closed mode (default: 50)")
+    parser.add_argument("--rate", type=float, default=100.0, help="Requests/second in open mode (default: 100)")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds per target (default: 10)")
+    parser.add_argument("--mix", default=None,
+                        help="Weighted URL paths, e.g. '/=3,/subdir/1.pdf=1' (default: the target URL's path)")
+    parser.add_argument("--keep-alive", action="store_true", help="Reuse connections between requests")
+    parser.add_argument("--timeout", type=float, default=10.0, help="Per-request timeout in seconds (default: 10)")
+    parser.add_argument("--max-inflight", type=int, default=1000,
+                        help="Open mode: cap on outstanding requests (default: 1000)")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for the URL mix")
+    parser.add_argument("--json", default=None, help="Write results to this JSON file")
+    args = parser.parse_args()
+
+    rows = []
+    for target in args.targets:
+        result = run_load(target, args.mode, args.concurrency, args.rate, args.duration, args.mix,
+                          args.keep_alive, args.timeout, args.max_inflight, args.seed)
+        rows.append((target, result.summary()))
+
+    print(f"\n{'='*98}")
+    load = f"concurrency={args.concurrency}" if args.mode == "closed" else f"rate={args.rate}/s"
+    print(f"mode={args.mode} {load} duration={args.duration}s keep_alive={args.keep_alive} mix={args.mix or 'target path'}")
+    print(f"{'='*98}")
+    print_comparison(rows)
+
+    if args.json:
+        report = {
+            "parameters": vars(args),
+            "results": [{"target": target, **summary} for target, summary in rows],
+        }
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nResults written to {args.json}")
@@ -0,0 +1,207 @@
+import mimetypes
+import os
+import stat
+import threading
+import time
+from collections import namedtuple
+
+# One indexed path: its stat, guessed MIME type (None for directories and
+# encoded files such as .gz) and the prebuilt 200 head for files the server
+# serves (None otherwise)
+ManifestEntry = namedtuple("ManifestEntry", ["stat", "content_type", "head"])
+
+
+class Manifest:
+    """In-memory index of every file and directory under `root`.
+
+    Built by walking the tree once at startup, so a request resolves its
+    path, existence, type, MIME type and validators with one dict lookup
+    instead of stat calls, and a path that is not in the index is a 404
+    without touching the disk. `file_head(stat_result, content_type)`
+    prebuilds the response head of each file, or returns None for files
+    that must not be served.
+
+    A background thread polls the mtime of every indexed directory and
+    rescans the ones that changed, which picks up files that are added,
+    removed, renamed or replaced by rename within `refresh_interval`
+    seconds. A file rewritten in place does not change its directory's
+    mtime, so it is only seen when something in that directory changes,
+    unless track_files() made the refresher re-stat every file as well.
+    """
+
+    def __init__(self, root, file_head=None, refresh_interval=2.0):
+        self.root = os.path.normpath(root)
+        self.file_head = file_head
+        self.refresh_interval = refresh_interval
+        self._entries = {}
+        self._children = {}  # Directory path -> names of the entries found in it
+        self._lock = threading.Lock()  # Serializes scans; lookups never take it
+        self._refresher = None
+        self.restat_files = False
+        self.indexed_at = 0.0  # Wall-clock start of the last build or refresh
+        self.build_seconds = 0.0
+        self.refreshes = 0
+        self.rescans = 0
+
+    def build(self):
+        """Index the whole tree. Returns the time it took in seconds."""
+        started = time.perf_counter()
+        with self._lock:
+            self.indexed_at = time.time()
+            self._entries[self.root] = ManifestEntry(os.stat(self.root), None, None)
+            self._scan(self.root, recursive=True)
+        self.build_seconds = time.perf_counter() - started
+        return self.build_seconds
+
+    def lookup(self, path):
+        """The entry for a normalized path, or None if it is not in the tree."""
+        return self._entries.get(path)
+
+    def walk(self, top):
+        """(path, entry) for `top` and everything indexed under it, parents first, from memory only.
+
+        Reads a snapshot of each directory's names, so it can run while the
+        refresher rescans.
+        """
+        entries = self._entries
+        children = self._children
+        stack = [top]
+        while stack:
+            path = stack.pop()
+            entry = entries.get(path)
+            if entry is None:
+                continue  # Removed since its directory was read
+            yield path, entry
+            names = children.get(path)
+            if names:
+                prefix = path if path.endswith(os.sep) else path + os.sep
+                stack.extend([prefix + name for name in sorted(names, reverse=True)])
+
+    def _file_entry(self, path, stat_result):
+        content_type, encoding = mimetypes.guess_type(path)
+        if encoding is not None:
+            content_type = None  # x.html.gz is the gzip form of x.html, not a file served on its own
+        head = self.file_head(stat_result, content_type) if self.file_head else None
+        return ManifestEntry(stat_result, content_type, head)
+
+    def _scan(self, directory, recursive):
+        """Re-read one directory's entries. Caller holds the lock.
+
+        New or replaced subdirectories are always scanned; unchanged known
+        ones only when `recursive`, since the refresher polls them on
+        their own.
+        """
+        self.rescans += 1
+        found = {}
+        try:
+            with os.scandir(directory) as it:
+                for dir_entry in it:
+                    try:
+                        found[dir_entry.name] = dir_entry.stat()
+                    except OSError:
+                        pass  # Removed since it was listed, or a dangling symlink
+        except OSError:
+            found = {}
+
+        for name in self._children.get(directory, set()) - found.keys():
+            self._remove(os.path.join(directory, name))
+        self._children[directory] = set(found)
+
+        for name, stat_result in found.items():
+            path = os.path.join(directory, name)
+            if stat.S_ISDIR(stat_result.st_mode):
+                old = self._entries.get(path)
+                changed = (path not in self._children or old.stat.st_ino != stat_result.st_ino
+                           or old.stat.st_mtime_ns != stat_result.st_mtime_ns)
+                self._entries[path] = ManifestEntry(stat_result, None, None)
+                if recursive or changed:
+                    if self._is_ancestor(stat_result, directory):
+                        continue  # A symlink back up the tree would recurse forever
+                    self._scan(path, recursive)
+            elif stat.S_ISREG(stat_result.st_mode):
+                if path in self._children:
+                    self._remove(path)  # Was a directory
+                self._entries[path] = self._file_entry(path, stat_result)
+
+    def _is_ancestor(self, stat_result, directory):
+        """Whether the directory described by `stat_result` is `directory` or one of its parents."""
+        while True:
+            parent = self._entries.get(directory)
+            if parent is not None and (parent.stat.st_dev, parent.stat.st_ino) == (stat_result.st_dev, stat_result.st_ino):
+                return True
+            if directory == self.root:
+                return False
+            directory = os.path.dirname(directory)
+
+    def _remove(self, path):
+        """Drop `path` and, for a directory, everything indexed under it."""
+        self._entries.pop(path, None)
+        for name in self._children.pop(path, ()):
+            self._remove(os.path.join(path, name))
+
+    def _restat(self):
+        """Re-stat every indexed file and update the ones changed in place. Caller holds the lock."""
+        entries = self._entries
+        children = self._children
+        for directory, names in list(children.items()):
+            prefix = directory if directory.endswith(os.sep) else directory + os.sep
+            for name in names:
+                path = prefix + name
+                entry = entries.get(path)
+                if entry is None or path in children:
+                    continue  # Removed meanwhile, or a directory
+                try:
+                    stat_result = os.stat(path)
+                except OSError:
+                    continue  # Its directory changed too and the rescan drops it
+                old = entry.stat
+                if (stat_result.st_mtime_ns != old.st_mtime_ns or stat_result.st_size != old.st_size
+                        or stat_result.st_ino != old.st_ino) and stat.S_ISREG(stat_result.st_mode):
+                    entries[path] = self._file_entry(path, stat_result)
+
+    def track_files(self):
+        """Also re-stat every file on each refresh, so edits made in place are picked up; refreshes now."""
+        self.restat_files = True
+        self.refresh()
+
+    def refresh(self):
+        """Rescan every directory whose mtime changed since it was indexed."""
+        with self._lock:
+            self.refreshes += 1
+            self.indexed_at = time.time()
+            for directory in list(self._children):
+                entry = self._entries.get(directory)
+                if entry is None:
+                    continue  # Removed by the rescan of its parent
+                try:
+                    stat_result = os.stat(directory)
+                except OSError:
+                    continue  # Its parent changed too and will drop it
+                if stat_result.st_mtime_ns != entry.stat.st_mtime_ns:
+                    self._entries[directory] = ManifestEntry(stat_result, None, None)
+                    self._scan(directory, recursive=False)
+            if self.restat_files:
+                self._restat()
+
+    def start_refresher(self):
+        """Start the daemon thread that keeps the index current."""
+        if self._refresher is not None or self.refresh_interval <= 0:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.refresh_interval)
+                self.refresh()
+
+        self._refresher = threading.Thread(target=run, name="manifest-refresher", daemon=True)
+        self._refresher.start()
+
+    def stats(self):
+        return {
+            "files": len(self._entries) - len(self._children),
+            "directories": len(self._children),
+            "build_ms": round(self.build_seconds * 1000, 3),
+            "refreshes": self.refreshes,
+            "rescans": self.rescans,
+            "restat_files": self.restat_files,
+        }
@@ -0,0 +1,159 @@
+import bisect
+import itertools
+import threading
+
+# Upper bounds (seconds) of the latency histogram buckets, Prometheus style
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005,
+    0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+# Request stages timed separately: waiting for a pool thread, head parsing,
+# building the response (stat, cache, listing), and writing it to the socket.
+STAGES = ("queue", "parse", "filesystem", "send")
+
+# Labels added to every sample, such as the worker process in --workers mode
+constant_labels = {}
+
+
+class _Shard:
+    """Everything one group of threads records, guarded by one lock."""
+
+    __slots__ = ("lock", "statuses", "buckets", "sums", "bytes_sent", "opened", "closed")
+
+    def __init__(self, num_buckets):
+        self.lock = threading.Lock()
+        self.statuses = {}
+        self.buckets = {stage: [0] * num_buckets for stage in STAGES}
+        self.sums = dict.fromkeys(STAGES, 0)
+        self.bytes_sent = 0
+        self.opened = 0
+        self.closed = 0
+
+
+def format_metric(name, kind, help_text, samples):
+    """Prometheus text exposition for one metric family.
+
+    `samples` is a list of (labels, value) with labels as a dict (or None).
+    """
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} {kind}"]
+    for labels, value in samples:
+        lines.append(f"{name}{format_labels(labels)} {value}")
+    return lines
+
+
+def format_labels(labels):
+    labels = {**constant_labels, **labels} if labels else constant_labels
+    if not labels:
+        return ""
+    pairs = []
+    for key, value in labels.items():
+        value = str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+        pairs.append(f'{key}="{value}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+class ServerMetrics:
+    """Request metrics for the /__metrics endpoint, cheap enough to leave on.
+
+    Like counters.ShardedCounter, each thread is pinned to one lock-striped
+    shard, so recording a request takes one uncontended lock and a bisect.
+    Shards are only merged when the endpoint is scraped. Gauges that other
+    components already know (queue depth, limiter state) are registered as
+    callables and read at scrape time instead of being tracked per request.
+    """
+
+    def __init__(self, num_shards=8, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._bounds_ns = [int(bound * 1e9) for bound in buckets]
+        self._shards = [_Shard(len(buckets) + 1) for _ in range(num_shards)]
+        self._next_shard = itertools.count()
+        self._local = threading.local()
+        self._gauges = {}
+        self._last_totals = {}
+
+    def _shard(self):
+        try:
+            return self._local.shard
+        except AttributeError:
+            shard = self._local.shard = self._shards[next(self._next_shard) % len(self._shards)]
+            return shard
+
+    def observe(self, stage, elapsed_ns):
+        """Record `elapsed_ns` spent in `stage`."""
+        index = bisect.bisect_left(self._bounds_ns, elapsed_ns)
+        shard = self._shard()
+        with shard.lock:
+            shard.buckets[stage][index] += 1
+            shard.sums[stage] += elapsed_ns
+
+    def record_response(self, status, nbytes, filesystem_ns=None, send_ns=None):
+        """Count one response; stage times are given when they were measured."""
+        shard = self._shard()
+        with shard.lock:
+            shard.statuses[status] = shard.statuses.get(status, 0) + 1
+            shard.bytes_sent += nbytes
+            if filesystem_ns is not None:
+                shard.buckets["filesystem"][bisect.bisect_left(self._bounds_ns, filesystem_ns)] += 1
+                shard.sums["filesystem"] += filesystem_ns
+            if send_ns is not None:
+                shard.buckets["send"][bisect.bisect_left(self._bounds_ns, send_ns)] += 1
+                shard.sums["send"] += send_ns
+
+    def connection_opened(self):
+        shard = self._shard()
+        with shard.lock:
+            shard.opened += 1
+
+    def connection_closed(self):
+        shard = self._shard()
+        with shard.lock:
+            shard.closed += 1
+
+    def register_gauge(self, name, help_text, read):
+        """Expose the value returned by `read()` at scrape time as a gauge."""
+        self._gauges[name] = (help_text, read)
+
+    def per_second(self, key, total, now):
+        """Average rate of a running total since the previous call with the same key."""
+        last_total, last_time = self._last_totals.get(key, (total, now))
+        self._last_totals[key] = (total, now)
+        elapsed = now - last_time
+        return (total - last_total) / elapsed if elapsed > 0 else 0.0
+
+    def render(self):
+        """Merged metrics as Prometheus text exposition lines."""
+        statuses = {}
+        buckets = {stage: [0] * (len(self.buckets) + 1) for stage in STAGES}
+        sums = dict.fromkeys(STAGES, 0)
+        bytes_sent = opened = closed = 0
+        for shard in self._shards:
+            with shard.lock:
+                for status, count in shard.statuses.items():
+                    statuses[status] = statuses.get(status, 0) + count
+                for stage in STAGES:
+                    buckets[stage] = list(map(int.__add__, buckets[stage], shard.buckets[stage]))
+                    sums[stage] += shard.sums[stage]
+                bytes_sent += shard.bytes_sent
+                opened += shard.opened
+                closed += shard.closed
+
+        lines = format_metric(
+            "http_responses_total", "counter", "Responses sent, by status code.",
+            [({"code": status}, count) for status, count in sorted(statuses.items())],
+        )
+        lines += ["# HELP http_stage_duration_seconds Time spent per request stage.",
+                  "# TYPE http_stage_duration_seconds histogram"]
+        for stage in STAGES:
+            cumulative = list(itertools.accumulate(buckets[stage]))
+            for bound, count in zip((*self.buckets, "+Inf"), cumulative):
+                lines.append(f'http_stage_duration_seconds_bucket{format_labels({"stage": stage, "le": bound})} {count}')
+            lines.append(f'http_stage_duration_seconds_sum{format_labels({"stage": stage})} {sums[stage] / 1e9}')
+            lines.append(f'http_stage_duration_seconds_count{format_labels({"stage": stage})} {cumulative[-1]}')
+        lines += format_metric("http_response_bytes_total", "counter", "Response bytes sent, heads included.",
+                               [(None, bytes_sent)])
+        lines += format_metric("http_active_connections", "gauge", "Client connections currently open.",
+                               [(None, opened - closed)])
+        for name, (help_text, read) in self._gauges.items():
+            lines += format_metric(name, "gauge", help_text, [(None, read())])
+        return lines
@@ -1,24 +1,146 @@
 import socket
 import os
+import stat
+import json
+import html
 import sys
 import mimetypes
 import urllib.parse
 import threading
 import time
-from collections import defaultdict
-from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import signal
+import multiprocessing
+import secrets
+import email.utils
+import zlib
+import functools
+from collections import namedtuple
+from json.encoder import encode_basestring_ascii
+
+from content_cache import CacheEntry, ContentCache, ListingCache
+from counters import ShardedCounter
+from rate_limiter import RateLimiter
+from shared_state import SharedCounter, SharedRateLimiter
+from frontend import SelectorFrontEnd
+from metrics import ServerMetrics, constant_labels, format_metric
+from admission import AdmissionControl
+from worker_pool import AdaptiveThreadPool
+from manifest import Manifest
+from access_log import DROP_POLICIES, AccessLog
+from profiler import Profiler
+from archive import ARCHIVE_TYPES, tar_stream, zip_stream
+from http_parser import BadRequest, RequestParser
 
 HOST = "0.0.0.0"
 PORT = 8080
 
-# Global counter for requests (thread-safe with lock)
-request_counter = defaultdict(int)
-counter_lock = threading.Lock()  # Lock for thread-safe counter
+# Global counter for requests (exact, lock-striped shards merged on read)
+request_counter = ShardedCounter()
+
+# Shared-memory counter table used with --workers; it is sized before forking
+COUNTER_STRIPES = 32
+DEFAULT_COUNTER_SLOTS = 32 * 2048
+COUNTER_SLOTS = 0  # --counter-slots; 0 sizes the table from the manifest
 
-# Rate limiting data structures
-rate_limit_data = defaultdict(list)  # IP -> list of request timestamps
-rate_limit_lock = threading.Lock()
+# Rate limiting: sustained requests/second per IP and the burst allowed on top
 MAX_REQUESTS_PER_SECOND = 5
+RATE_LIMIT_BURST = 5
+rate_limiter = RateLimiter(MAX_REQUESTS_PER_SECOND, RATE_LIMIT_BURST)
+
+# Accept backlog for the asyncio server, sized for thousands of connections
+ASYNC_BACKLOG = 1024
+# Accept backlog for the threaded servers; a full backlog drops SYNs and clients retry after ~1s
+LISTEN_BACKLOG = 128
+
+# Worker pool: grows while every thread is busy, shrinks after WORKER_IDLE_TIMEOUT
+MIN_WORKERS = 4
+MAX_WORKERS = 64
+WORKER_IDLE_TIMEOUT = 10.0  # Seconds an idle thread above MIN_WORKERS is kept
+worker_pool = None  # AdaptiveThreadPool of the running server, if any
+
+# Admission control in front of the thread pool
+MAX_PENDING = 128  # Requests (connections with --blocking-pool) allowed to wait for a worker
+RETRY_AFTER = 1  # Seconds a client refused with 503 is asked to wait
+admission = None  # AdmissionControl of the running pool, if any
+
+# HTTP/1.1 persistent connections
+KEEP_ALIVE_TIMEOUT = 5.0  # Seconds an idle connection is kept open
+MAX_KEEP_ALIVE_REQUESTS = 100  # Requests served before the connection is closed
+MAX_HEADER_SIZE = 8192  # Largest accepted request head in bytes; larger heads get 431
+MAX_HEADER_COUNT = 100  # Most header lines accepted in one request
+
+# Per-phase timeouts of the selector front end (pool mode)
+HEADER_TIMEOUT = 10.0  # Seconds to receive a complete request once it has started
+SEND_TIMEOUT = 30.0  # Seconds a response write may make no progress
+
+# Shared cache of complete responses for hot files
+CACHE_MAX_BYTES = 64 * 1024 * 1024  # Total budget for cached responses
+CACHE_MAX_ENTRY_BYTES = 1024 * 1024  # Larger files are always streamed with sendfile
+content_cache = ContentCache(CACHE_MAX_BYTES, CACHE_MAX_ENTRY_BYTES)
+
+# Scanned directory listings, invalidated by directory mtime
+listing_cache = ListingCache()
+
+# Optional in-memory index of the served tree (--manifest), refreshed in the background
+MANIFEST_REFRESH = 2.0  # Seconds between polls of the indexed directories' mtimes
+manifest = None
+
+# Index behind SYNC_MANIFEST_PATH: the --manifest one, or one built on first use
+sync_index = None
+sync_index_lock = threading.Lock()
+
+# Access log written by a background thread (--access-log PATH)
+access_log = None
+
+# Per-stage timing and cProfile collection (--profile); dumped on SIGUSR1
+profiler = None
+
+# Stages timed in --profile mode: (stage, function wrapped). "read" includes
+# waiting for the client in the blocking modes; "build" includes "listing",
+# "counter", "file_read" and "gzip".
+PROFILE_STAGES = [
+    ("read", "read_request"),
+    ("read", "read_request_async"),
+    ("rate_limit", "check_rate_limit"),
+    ("build", "build_response"),
+    ("listing", "generate_directory_listing"),
+    ("counter", "increment_counter"),
+    ("file_read", "read_file"),
+    ("gzip", "gzip_compress"),
+    ("send", "send_response"),
+    ("send", "send_response_async"),
+    ("access_log", "log_access"),
+]
+
+# Only these types are served; other files are answered with 404
+SERVED_TYPES = {"text/html", "image/png", "application/pdf"}
+
+# Internal endpoint reporting cache (and other) counters as JSON
+STATS_PATH = "/__stats"
+
+# Request metrics in Prometheus text format
+METRICS_PATH = "/__metrics"
+metrics = ServerMetrics()
+
+# Path, size, mtime and ETag of every served file under a subtree, as JSON:
+# /__manifest/<subtree>?since=<POSIX seconds>
+SYNC_MANIFEST_PATH = "/__manifest"
+
+# Byte-range requests: more ranges than this are answered with the whole file
+MAX_RANGES = 16
+
+# gzip content negotiation
+COMPRESSIBLE_TYPES = {"text/html"}  # Compressed in memory when no .gz sibling exists
+INCOMPRESSIBLE_TYPES = {"image/png"}  # Already compressed; never gzipped, no .gz lookup
+GZIP_MIN_SIZE = 256  # Smaller bodies barely shrink, or even grow
+GZIP_STATIC_LEVEL = 9  # Cached file bodies are compressed once, so use the best ratio
+GZIP_DYNAMIC_LEVEL = 6  # Listings are compressed on every request
+VARY_ACCEPT_ENCODING = "Vary: Accept-Encoding"
+VARY_LISTING = "Vary: Accept, Accept-Encoding"  # Listings are also negotiated as HTML or JSON
+# Live request counts: caches may store a listing but must revalidate it on every use
+CACHE_CONTROL_NO_CACHE = "Cache-Control: no-cache"
+CONTENT_ENCODING_GZIP = "Content-Encoding: gzip"
 
 
 def normalize_path(path):
@@ -28,182 +150,1275 @@ def normalize_path(path):
 
 def check_rate_limit(client_ip):
     """Check if client has exceeded rate limit. Returns True if allowed, False if blocked."""
-    with rate_limit_lock:
-        current_time = time.time()
-        # Clean up old timestamps (older than 1 second)
-        rate_limit_data[client_ip] = [
-            ts for ts in rate_limit_data[client_ip]
-            if current_time - ts < 1.0
-        ]
-
-        # Check if rate limit exceeded
-        if len(rate_limit_data[client_ip]) >= MAX_REQUESTS_PER_SECOND:
-            return False
-
-        # Add current request timestamp
-        rate_limit_data[client_ip].append(current_time)
-        return True
+    return rate_limiter.allow(client_ip)
+
+
+def inside_root(path, base_dir):
+    """Whether the normalized `path` is `base_dir` itself or below it."""
+    root = normalize_path(base_dir)
+    return path == root or path.startswith(root.rstrip(os.sep) + os.sep)
+
+
+def served_type(path):
+    """MIME type `path` is served as, or None if it is not served.
+
+    Encoded files such as index.html.gz are only ever sent as the gzip
+    representation of the file they were made from, never on their own.
+    """
+    content_type, encoding = mimetypes.guess_type(path)
+    if encoding is not None or content_type not in SERVED_TYPES:
+        return None
+    return content_type
 
 
 def increment_counter(file_path, use_lock=True):
     """Increment request counter for a file. Can disable lock to show race condition."""
     file_path = normalize_path(file_path)
     if use_lock:
-        with counter_lock:
-            request_counter[file_path] += 1
+        request_counter.increment(file_path)
     else:
-        current = request_counter[file_path]
-        time.sleep(0.001)  # Delay to force interleaving
-        request_counter[file_path] = current + 1
+        request_counter.increment_racy(file_path)
 
 
-def generate_directory_listing(directory, request_path, use_lock=True):
-    """Generate a simple HTML page listing directory contents with request counts."""
-    directory = normalize_path(directory)
-    entries = os.listdir(directory)
-    entries.sort(key=str.lower)
+LISTING_ROW_SUFFIX = " requests)</span></li>"
+LISTING_STREAM_ROWS = 1000  # Pages with more rows are streamed with chunked encoding
+LISTING_BATCH_ROWS = 1000  # Rows rendered per chunk
 
-    # Get count for the current directory itself
-    if use_lock:
-        with counter_lock:
-            dir_count = request_counter[directory]
-    else:
-        dir_count = request_counter[directory]
+# One entry of a scanned directory: its counter key (the normalized full
+# path), the pre-rendered HTML up to the count, its name and whether it is
+# a directory
+ListingRow = namedtuple("ListingRow", ["key", "prefix", "name", "is_dir"])
 
-    html = f"<html><head><title>Index of {request_path}</title></head><body>"
-    html += f"<h1>Index of {request_path}</h1>"
-    html += f"<p><em>Request counts shown in parentheses. This directory: {dir_count} requests</em></p>"
-    html += "<ul>"
 
+def scan_directory(directory, request_path):
+    """Scan a directory once and pre-render everything in its listing except the counts.
+
+    Returns (parent_html, rows) where rows is a sorted list of ListingRow.
+    os.scandir reports the entry type from the directory itself, so no
+    per-entry stat is needed. Encoded files such as .gz siblings are left out.
+    """
+    with os.scandir(directory) as it:
+        entries = sorted(it, key=lambda entry: entry.name.lower())
+
+    parent_html = ""
     if request_path != "/":
         parent_path = os.path.dirname(request_path.rstrip("/"))
         if not parent_path:
             parent_path = "/"
         if parent_path == "/":
-            html += '<li><a href="/">Parent Directory</a></li>'
+            parent_html = '<li><a href="/">Parent Directory</a></li>'
         else:
-            html += f'<li><a href="{urllib.parse.quote(parent_path)}/">Parent Directory</a></li>'
+            parent_html = f'<li><a href="{urllib.parse.quote(parent_path)}/">Parent Directory</a></li>'
 
+    rows = []
     for entry in entries:
-        full_path = normalize_path(os.path.join(directory, entry))
-        display_name = entry + "/" if os.path.isdir(full_path) else entry
-        link_path = os.path.join(request_path, entry).replace("\\", "/")
-
-        # Get request count for this file/directory
-        if use_lock:
-            with counter_lock:
-                count = request_counter[full_path]
-        else:
-            count = request_counter[full_path]
-
-        if os.path.isdir(full_path):
+        is_dir = entry.is_dir()
+        if not is_dir and mimetypes.guess_type(entry.name)[1] is not None:
+            continue  # Precompressed siblings are served through their original
+        link_path = os.path.join(request_path, entry.name).replace("\\", "/")
+        display_name = html.escape(entry.name)
+        if is_dir:
             link_path += "/"
-            html += f'<li><a href="{urllib.parse.quote(link_path)}">{display_name}</a> <span style="color: #666;">({count} requests)</span></li>'
-        else:
-            html += f'<li><a href="{urllib.parse.quote(link_path)}">{display_name}</a> <span style="color: #666;">({count} requests)</span></li>'
+            display_name += "/"
+        row_prefix = f'<li><a href="{urllib.parse.quote(link_path)}">{display_name}</a> <span style="color: #666;">('
+        rows.append(ListingRow(normalize_path(entry.path), row_prefix, entry.name, is_dir))
+    return parent_html, rows
 
-    html += "</ul></body></html>"
-    return html.encode("utf-8")
 
+def listing_index(directory, request_path, stat_result=None):
+    """The cached (parent_html, rows) of a directory, rescanned when its mtime changes.
 
-def handle_client(conn, addr, base_dir, use_lock=True, add_delay=False):
-    """Handle client request with optional delay and lock control."""
-    client_ip = addr[0]
+    `stat_result` is the directory's stat when the caller already has it.
+    """
+    key = (directory, request_path)
+    # Stat before scanning: a change made during the scan bumps the mtime
+    # again and the next request rescans.
+    if stat_result is None:
+        stat_result = os.stat(directory)
+    mtime_ns = stat_result.st_mtime_ns
+    template = listing_cache.get(key, mtime_ns)
+    if template is None:
+        template = scan_directory(directory, request_path)
+        listing_cache.put(key, mtime_ns, template)
+    return template
+
+
+def listing_page(params):
+    """(offset, limit) from a listing's parsed query; limit is None for all entries. Raises ValueError."""
+    offset = int(params.get("offset", ["0"])[0])
+    limit = int(params["limit"][0]) if "limit" in params else None
+    if offset < 0 or (limit is not None and limit < 1):
+        raise ValueError("offset must not be negative and limit must be positive")
+    return offset, limit
 
+
+def generate_directory_listing(directory, request_path, stat_result=None, offset=0, limit=None, as_json=False):
+    """Generate a simple HTML page listing directory contents with request counts.
+
+    The scanned entries are cached until the directory's mtime changes; only
+    the live request counts are filled in per request. `offset` and `limit`
+    select one page of the sorted entries; `as_json` renders it as JSON.
+    """
+    return b"".join(listing_chunks(normalize_path(directory), request_path, stat_result, offset, limit, as_json))
+
+
+def listing_chunks(directory, request_path, stat_result=None, offset=0, limit=None, as_json=False):
+    """The encoded listing page as an iterator of chunks, for streaming."""
+    parent_html, rows = listing_index(directory, request_path, stat_result)
+    if as_json:
+        return listing_json_chunks(directory, request_path, rows, offset, limit)
+    return listing_html_chunks(directory, request_path, parent_html, rows, offset, limit)
+
+
+def listing_page_rows(directory, request_path, stat_result, offset, limit):
+    """How many entries a listing page shows."""
+    total = len(listing_index(directory, request_path, stat_result)[1])
+    shown = max(0, total - offset)
+    return shown if limit is None else min(shown, limit)
+
+
+def listing_html_chunks(directory, request_path, parent_html, rows, offset=0, limit=None):
+    """The HTML listing of rows[offset:offset + limit], encoded, in chunks of LISTING_BATCH_ROWS rows.
+
+    The directory's count and every count on the page come from one
+    snapshot, taken before the first chunk.
+    """
+    total = len(rows)
+    end = total if limit is None else min(total, offset + limit)
+    page = rows[offset:end]
+    dir_count, *counts = request_counter.snapshot([directory, *[row.key for row in page]])
+    parts = [
+        f"<html><head><title>Index of {request_path}</title></head><body>",
+        f"<h1>Index of {request_path}</h1>",
+        f"<p><em>Request counts shown in parentheses. This directory: {dir_count} requests</em></p>",
+    ]
+    if offset or end < total:
+        base = urllib.parse.quote(request_path)
+        page_size = limit if limit is not None else max(1, total)
+        links = []
+        if offset > 0:
+            links.append(f'<a href="{base}?offset={max(0, offset - page_size)}&amp;limit={page_size}">Previous</a>')
+        if end < total:
+            links.append(f'<a href="{base}?offset={end}&amp;limit={page_size}">Next</a>')
+        parts.append(f"<p>Entries {min(offset + 1, total)}-{end} of {total} {' '.join(links)}</p>")
+    parts.append("<ul>")
+    parts.append(parent_html)
+
+    for batch_start in range(0, len(page), LISTING_BATCH_ROWS):
+        batch_end = batch_start + LISTING_BATCH_ROWS
+        for row, count in zip(page[batch_start:batch_end], counts[batch_start:batch_end]):
+            parts.append(row.prefix)
+            parts.append(str(count))
+            parts.append(LISTING_ROW_SUFFIX)
+        yield "".join(parts).encode("utf-8")
+        parts = []
+    parts.append("</ul></body></html>")
+    yield "".join(parts).encode("utf-8")
+
+
+def entry_stat(path):
+    """Stat of a listed entry, from the manifest when there is one; None if it vanished."""
+    if manifest is not None:
+        indexed = manifest.lookup(path)
+        return indexed.stat if indexed is not None else None
     try:
-        # Check rate limit
-        if not check_rate_limit(client_ip):
-            response = (
-                b"HTTP/1.1 429 Too Many Requests\r\n"
-                b"Content-Type: text/html\r\n\r\n"
-                b"<html><body><h1>429 Too Many Requests</h1>"
-                b"<p>Rate limit exceeded. Please slow down.</p></body></html>"
-            )
-            conn.sendall(response)
-            return
+        return os.stat(path)
+    except OSError:
+        return None
 
-        # Add delay to simulate work (for testing)
-        if add_delay:
-            time.sleep(1.0)
 
-        request = conn.recv(2048).decode("utf-8", errors="ignore")
-        if not request:
-            return
+def listing_json_chunks(directory, request_path, rows, offset=0, limit=None):
+    """The JSON listing of rows[offset:offset + limit], encoded, in chunks of LISTING_BATCH_ROWS rows.
 
-        request_line = request.splitlines()[0]
-        method, path, _ = request_line.split()
+    Entries carry name, type, size (null for directories), mtime (POSIX
+    seconds) and request count. Sizes and mtimes are read per request,
+    since editing a file does not change its directory's mtime. All counts
+    on the page come from one snapshot.
+    """
+    total = len(rows)
+    end = total if limit is None else min(total, offset + limit)
+    page = rows[offset:end]
+    counts = request_counter.snapshot([row.key for row in page])
+    head = {"path": request_path, "total": total, "offset": offset, "limit": limit}
+    yield (json.dumps(head)[:-1] + ', "entries": [').encode("utf-8")
+    separator = ""
+    for batch_start in range(0, len(page), LISTING_BATCH_ROWS):
+        batch_end = batch_start + LISTING_BATCH_ROWS
+        items = []
+        for row, count in zip(page[batch_start:batch_end], counts[batch_start:batch_end]):
+            entry_stat_result = entry_stat(row.key)
+            items.append(json.dumps({
+                "name": row.name,
+                "type": "directory" if row.is_dir else "file",
+                "size": None if row.is_dir or entry_stat_result is None else entry_stat_result.st_size,
+                "mtime": entry_stat_result.st_mtime if entry_stat_result is not None else None,
+                "requests": count,
+            }))
+        yield (separator + ", ".join(items)).encode("utf-8")
+        separator = ", "
+    yield b"]}"
 
-        if method != "GET":
-            conn.sendall(b"HTTP/1.1 405 Method Not Allowed\r\n\r\n")
-            return
 
-        path = urllib.parse.unquote(path)
-        file_path = normalize_path(os.path.join(base_dir, path.lstrip("/")))
+# Part of a response body that is sent straight from the file with sendfile
+FileSegment = namedtuple("FileSegment", ["path", "offset", "count"])
 
-        # Handle directory requests
-        if os.path.isdir(file_path):
-            increment_counter(file_path, use_lock)
-            body = generate_directory_listing(file_path, path, use_lock)
-            header = (
-                "HTTP/1.1 200 OK\r\nContent-Type: text/html\r\n"
-                f"Content-Length: {len(body)}\r\n\r\n"
-            )
-            conn.sendall(header.encode("utf-8") + body)
-            return
 
-        # Handle file not found
-        if not os.path.exists(file_path):
-            conn.sendall(
-                b"HTTP/1.1 404 Not Found\r\nContent-Type: text/html\r\n\r\n"
-                b"<html><body><h1>404 Not Found</h1></body></html>"
-            )
-            return
+class ChunkedBody:
+    """Part of a response body that is generated while it is sent, with chunked transfer coding.
 
-        # Check MIME type
-        mime_type, _ = mimetypes.guess_type(file_path)
-        if mime_type not in ["text/html", "image/png", "application/pdf"]:
-            conn.sendall(
-                b"HTTP/1.1 404 Not Found\r\nContent-Type: text/html\r\n\r\n"
-                b"<html><body><h1>404 Not Found</h1></body></html>"
-            )
+    `chunks` yields the body as bytes; `sent` counts the bytes put on the
+    wire, framing included, for the metrics and the access log. An
+    unframed body is sent as is and ended by closing the connection, for
+    HTTP/1.0 clients.
+    """
+
+    def __init__(self, chunks, framed=True):
+        self.chunks = chunks
+        self.framed = framed
+        self.sent = 0
+
+    def encoded(self):
+        """The framed chunks, ending with the zero-length last chunk."""
+        if not self.framed:
+            for chunk in self.chunks:
+                self.sent += len(chunk)
+                yield chunk
             return
+        for chunk in self.chunks:
+            if chunk:  # An empty chunk would end the body
+                framed = b"%x\r\n%s\r\n" % (len(chunk), chunk)
+                self.sent += len(framed)
+                yield framed
+        self.sent += 5
+        yield b"0\r\n\r\n"
+
+
+# Lets the kernel coalesce a response head with the file data that follows it
+MSG_MORE = getattr(socket, "MSG_MORE", 0)
+
+
+RATE_LIMITED_BODY = (
+    b"<html><body><h1>429 Too Many Requests</h1>"
+    b"<p>Rate limit exceeded. Please slow down.</p></body></html>"
+)
+NOT_FOUND_BODY = b"<html><body><h1>404 Not Found</h1></body></html>"
+BAD_REQUEST_BODY = b"<html><body><h1>400 Bad Request</h1></body></html>"
+HEADER_TOO_LARGE_BODY = b"<html><body><h1>431 Request Header Fields Too Large</h1></body></html>"
+SERVICE_UNAVAILABLE_BODY = (
+    b"<html><body><h1>503 Service Unavailable</h1>"
+    b"<p>The server is overloaded. Please retry shortly.</p></body></html>"
+)
+
+
+def connection_header(keep_alive):
+    """Connection headers plus the blank line that ends the response head."""
+    if keep_alive:
+        return f"Connection: keep-alive\r\nKeep-Alive: timeout={int(KEEP_ALIVE_TIMEOUT)}, max={MAX_KEEP_ALIVE_REQUESTS}\r\n\r\n".encode("utf-8")
+    return b"Connection: close\r\n\r\n"
+
+
+def status_headers(status, content_length, content_type=None, extra_headers=(), chunked=True):
+    """Status line and entity headers; independent of the connection, so they can be cached.
+
+    `extra_headers` are complete "Name: value" lines added after the standard ones.
+    A `content_length` of None announces a chunked body, or with `chunked`
+    false one that ends when the connection closes.
+    """
+    header = f"HTTP/1.1 {status}\r\n"
+    if content_type:
+        header += f"Content-Type: {content_type}\r\n"
+    if content_length is None:
+        if chunked:
+            header += "Transfer-Encoding: chunked\r\n"
+    else:
+        header += f"Content-Length: {content_length}\r\n"
+    for line in extra_headers:
+        header += f"{line}\r\n"
+    return header.encode("utf-8")
+
+
+def http_head(status, content_length, content_type=None, keep_alive=False, extra_headers=()):
+    """Complete response head, including Content-Length so the response can share a connection."""
+    return status_headers(status, content_length, content_type, extra_headers) + connection_header(keep_alive)
+
+
+def http_response(status, body=b"", content_type="text/html", keep_alive=False):
+    """Assemble a complete in-memory response."""
+    return http_head(status, len(body), content_type if body else None, keep_alive) + body
+
+
+def overloaded_response():
+    """503 sent when the pending queue is full; the connection is closed after it."""
+    return http_head("503 Service Unavailable", len(SERVICE_UNAVAILABLE_BODY), "text/html",
+                     extra_headers=[f"Retry-After: {RETRY_AFTER}"]) + SERVICE_UNAVAILABLE_BODY
 
-        # Increment counter for this file
+
+def new_request_parser():
+    """Request parser for one connection, with the configured limits and parse-time metric."""
+    if profiler is not None:
+        def on_parse(elapsed_ns):
+            metrics.observe("parse", elapsed_ns)
+            profiler.add("parse", elapsed_ns)
+    else:
+        def on_parse(elapsed_ns):
+            metrics.observe("parse", elapsed_ns)
+    return RequestParser(MAX_HEADER_SIZE, MAX_HEADER_COUNT, on_parse)
+
+
+def error_response(error):
+    """400 or 431 for a request that could not be parsed; the connection is closed after it."""
+    body = HEADER_TOO_LARGE_BODY if error.status.startswith("431") else BAD_REQUEST_BODY
+    return http_response(error.status, body)
+
+
+def wants_keep_alive(request):
+    """HTTP/1.1 connections persist unless closed; HTTP/1.0 ones only when asked to."""
+    connection = request.headers.get("connection", "").lower()
+    if request.version == "HTTP/1.1":
+        return "close" not in connection
+    return "keep-alive" in connection
+
+
+def http_date(timestamp):
+    """Format a POSIX timestamp as an HTTP date (RFC 9110 IMF-fixdate)."""
+    return email.utils.formatdate(timestamp, usegmt=True)
+
+
+def file_etag(stat_result):
+    """Strong entity tag for a file, built from its inode, size and mtime without reading it."""
+    return f'"{stat_result.st_ino:x}-{stat_result.st_size:x}-{stat_result.st_mtime_ns:x}"'
+
+
+def validator_headers(etag, stat_result):
+    return [f"ETag: {etag}", f"Last-Modified: {http_date(stat_result.st_mtime)}"]
+
+
+def is_not_modified(request, etag, stat_result):
+    """Evaluate If-None-Match, or failing that If-Modified-Since, against the current validators."""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        if if_none_match.strip() == "*":
+            return True
+        # Weak comparison: W/ prefixes are ignored on both sides
+        current = etag[2:] if etag.startswith("W/") else etag
+        for candidate in if_none_match.split(","):
+            candidate = candidate.strip()
+            if candidate.startswith("W/"):
+                candidate = candidate[2:]
+            if candidate == current:
+                return True
+        return False
+
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False  # Invalid dates are ignored
+        return int(stat_result.st_mtime) <= since.timestamp()
+    return False
+
+
+def not_modified_response(etag, stat_result, keep_alive, extra_headers=()):
+    """Body-less 304 carrying the validators the client should keep."""
+    header = "HTTP/1.1 304 Not Modified\r\n"
+    for line in [*validator_headers(etag, stat_result), *extra_headers]:
+        header += f"{line}\r\n"
+    return header.encode("utf-8") + connection_header(keep_alive)
+
+
+def accepts_gzip(request):
+    """Whether the request's Accept-Encoding allows a gzip-encoded response."""
+    wildcard = False
+    for item in request.headers.get("accept-encoding", "").split(","):
+        coding, *params = item.split(";")
+        coding = coding.strip().lower()
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding in ("gzip", "x-gzip"):
+            return quality > 0
+        if coding == "*":
+            wildcard = quality > 0
+    return wildcard
+
+
+def gzip_compress(data, level):
+    """gzip-framed deflate of `data` (wbits=31 makes zlib write the gzip header and trailer)."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    return compressor.compress(data) + compressor.flush()
+
+
+def gzip_stream(chunks, level):
+    """gzip_compress for a body produced in chunks; yields compressed chunks, some possibly empty."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        yield compressor.compress(chunk)
+    yield compressor.flush()
+
+
+def wants_json(request):
+    """Whether the request's Accept prefers application/json to text/html, for listings."""
+    accept = request.headers.get("accept")
+    if not accept:
+        return False
+    # Quality of each media range; the most specific range matching a type decides
+    qualities = {}
+    for item in accept.split(","):
+        media_range, *params = item.split(";")
+        quality = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name.lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[media_range.strip().lower()] = quality
+
+    def quality_of(media_type):
+        for candidate in (media_type, media_type.split("/")[0] + "/*", "*/*"):
+            if candidate in qualities:
+                return qualities[candidate]
+        return 0.0
+
+    return quality_of("application/json") > quality_of("text/html")
+
+
+def gzip_etag(etag):
+    """Entity tag of the gzip representation; it must differ from the identity one."""
+    return etag[:-1] + '-gzip"'
+
+
+def precompressed_sibling(file_path, stat_result):
+    """(path, stat) of an up-to-date `<file>.gz` next to `file_path`, or None."""
+    sibling_path = file_path + ".gz"
+    if manifest is not None:
+        indexed = manifest.lookup(sibling_path)
+        if indexed is None:
+            return None
+        sibling_stat = indexed.stat
+    else:
+        try:
+            sibling_stat = os.stat(sibling_path)
+        except OSError:
+            return None
+    if not stat.S_ISREG(sibling_stat.st_mode) or sibling_stat.st_mtime_ns < stat_result.st_mtime_ns:
+        return None  # Older than the file it was made from
+    return sibling_path, sibling_stat
+
+
+def gzip_cache_entry(file_path, stat_result, content_type, body):
+    """Cached gzip copy of a small file's `body`, compressed once per (path, mtime).
+
+    Stored in the content cache next to the identity entry and validated
+    against the original file's stat, so it is rebuilt when the file changes.
+    """
+    key = (file_path, "gzip")
+    entry = content_cache.get(key, stat_result)
+    if entry is None:
+        compressed = gzip_compress(body, GZIP_STATIC_LEVEL)
+        etag = gzip_etag(file_etag(stat_result))
+        head = status_headers("200 OK", len(compressed), content_type,
+                              ["Accept-Ranges: bytes", *validator_headers(etag, stat_result)])
+        content_cache.put(key, stat_result, head, compressed, content_type)
+        entry = CacheEntry(stat_result.st_mtime_ns, stat_result.st_size, head, compressed, content_type)
+    return entry
+
+
+def parse_range_header(value, size):
+    """Parse a Range header against a file of `size` bytes.
+
+    Returns a list of (start, end) pairs with inclusive ends, clamped to the
+    file, or an empty list if no range overlaps the file (416). Returns
+    None when the header is malformed, not in bytes, or asks for too many
+    ranges; the header is then ignored and the whole file is sent.
+    """
+    unit, sep, spec = value.partition("=")
+    if not sep or unit.strip().lower() != "bytes":
+        return None
+    ranges = []
+    for item in spec.split(","):
+        first, dash, last = item.strip().partition("-")
+        if not dash:
+            return None
+        try:
+            if first:
+                start = int(first)
+                end = int(last) if last else start + size
+                if start < 0 or end < start:
+                    return None
+            else:
+                suffix = int(last)  # "-N": the last N bytes
+                if suffix < 0:
+                    return None
+                if suffix == 0:
+                    continue
+                start, end = max(0, size - suffix), size - 1
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+    if len(ranges) > MAX_RANGES:
+        return None
+    return ranges
+
+
+def if_range_matches(request, etag, stat_result):
+    """Whether a Range request should be honoured, given its optional If-Range validator.
+
+    The validator must name the exact version on disk; otherwise the client's
+    partial copy is stale and the full file is sent instead.
+    """
+    validator = request.headers.get("if-range")
+    if validator is None:
+        return True
+    if validator.startswith(('"', "W/")):
+        return validator == etag  # Strong comparison; weak tags never match
+    try:
+        since = email.utils.parsedate_to_datetime(validator)
+    except (TypeError, ValueError):
+        return False
+    return int(since.timestamp()) == int(stat_result.st_mtime)
+
+
+def body_slice(source, start, count):
+    """Part covering `count` bytes at `start` of a cached body (bytes) or a file on disk (path)."""
+    if isinstance(source, bytes):
+        return memoryview(source)[start:start + count]
+    return FileSegment(source, start, count)
+
+
+def range_response(ranges, size, content_type, source, keep_alive, extra_headers=()):
+    """206 response parts for satisfiable `ranges` of `source`, or a 416 if there are none.
+
+    A single range is sent as-is; several are sent as multipart/byteranges.
+    Both stream the body parts, and Content-Length is always computed up
+    front so the connection can stay open.
+    """
+    if not ranges:
+        return [http_head("416 Range Not Satisfiable", 0, keep_alive=keep_alive,
+                          extra_headers=[f"Content-Range: bytes */{size}"])]
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        count = end - start + 1
+        head = http_head("206 Partial Content", count, content_type, keep_alive,
+                         ["Accept-Ranges: bytes", f"Content-Range: bytes {start}-{end}/{size}", *extra_headers])
+        return [head, body_slice(source, start, count)]
+
+    boundary = secrets.token_hex(16)
+    parts = []
+    length = 0
+    for index, (start, end) in enumerate(ranges):
+        part_head = (
+            ("" if index == 0 else "\r\n") + f"--{boundary}\r\n"
+            f"Content-Type: {content_type}\r\n"
+            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("utf-8")
+        parts.append(part_head)
+        parts.append(body_slice(source, start, end - start + 1))
+        length += len(part_head) + end - start + 1
+    closing = f"\r\n--{boundary}--\r\n".encode("utf-8")
+    parts.append(closing)
+    length += len(closing)
+    head = http_head("206 Partial Content", length, f"multipart/byteranges; boundary={boundary}", keep_alive,
+                     ["Accept-Ranges: bytes", *extra_headers])
+    return [head] + parts
+
+
+def render_metrics():
+    """Prometheus text for METRICS_PATH: request metrics plus the counters the server already keeps."""
+    lines = metrics.render()
+    rejected = rate_limiter.rejected_total()
+    lines += format_metric("http_rate_limit_rejections_total", "counter", "Requests answered with 429.",
+                           [(None, rejected)])
+    lines += format_metric("http_rate_limit_rejections_per_second", "gauge",
+                           "429 responses per second since the previous scrape.",
+                           [(None, round(metrics.per_second("rate_limit_rejections", rejected, time.monotonic()), 3))])
+    lines += format_metric("http_rate_limit_tracked_clients", "gauge", "Clients with live rate-limit state.",
+                           [(None, rate_limiter.stats()["tracked_clients"])])
+    if admission is not None:
+        lines += format_metric("http_admission_rejections_total", "counter",
+                               "Requests refused with 503 because the pending queue was full.",
+                               [(None, admission.rejected)])
+    # Per-file totals; the prefork shared counter stores digests and cannot list its keys
+    if isinstance(request_counter, ShardedCounter):
+        lines += format_metric("http_path_requests_total", "counter", "Requests per file or directory.",
+                               [({"path": key}, count) for key, count in sorted(request_counter.items())])
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def response_status(parts):
+    """Status code of a built response, read back from its status line."""
+    return int(parts[0][9:12])
+
+
+def response_size(parts):
+    """Bytes sent for a response; only final once it has been sent, for chunked bodies."""
+    size = 0
+    for part in parts:
+        if isinstance(part, FileSegment):
+            size += part.count
+        elif isinstance(part, ChunkedBody):
+            size += part.sent
+        else:
+            size += len(part)
+    return size
+
+
+def server_stats():
+    """Internal counters served as JSON on STATS_PATH; with --workers, those of the worker that answers."""
+    return {
+        "worker": dict(constant_labels) or None,
+        "cache": content_cache.stats(),
+        "listings": listing_cache.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "admission": admission.stats() if admission is not None else None,
+        "pool": worker_pool.stats() if worker_pool is not None else None,
+        "manifest": (manifest or sync_index).stats() if (manifest or sync_index) is not None else None,
+        "access_log": access_log.stats() if access_log is not None else None,
+        "profile": profiler.stage_stats() if profiler is not None else None,
+    }
+
+
+def build_response(request, base_dir, use_lock=True, keep_alive=False):
+    """Build the HTTP response for a parsed request as a list of parts.
+
+    Parts are bytes, FileSegment for file bodies that are streamed from
+    disk when sent, or ChunkedBody for large listings and archives generated
+    as they are sent. Shared by the threaded and asyncio front ends so both
+    serve the same listings, files and counters.
+    """
+    if request.method != "GET":
+        return [http_response("405 Method Not Allowed", keep_alive=keep_alive)]
+
+    raw_path, _, query = request.path.partition("?")
+    if raw_path == STATS_PATH:
+        body = json.dumps(server_stats(), indent=2).encode("utf-8")
+        return [http_response("200 OK", body, "application/json", keep_alive)]
+
+    if raw_path == METRICS_PATH:
+        return [http_response("200 OK", render_metrics(), "text/plain; version=0.0.4", keep_alive)]
+
+    if raw_path == SYNC_MANIFEST_PATH or raw_path.startswith(SYNC_MANIFEST_PATH + "/"):
+        subtree = urllib.parse.unquote(raw_path[len(SYNC_MANIFEST_PATH):])
+        return sync_manifest_response(request, base_dir, subtree, query, keep_alive)
+
+    path = urllib.parse.unquote(raw_path)
+    file_path = normalize_path(os.path.join(base_dir, path.lstrip("/")))
+    if not inside_root(file_path, base_dir):
+        # "../" segments, also percent-encoded ones, must not climb out of the served tree
+        return [http_response("404 Not Found", NOT_FOUND_BODY, keep_alive=keep_alive)]
+
+    # One stat, or one manifest lookup, answers "directory?", "exists?" and validates the cache
+    indexed = None
+    if manifest is not None:
+        indexed = manifest.lookup(file_path)
+        if indexed is None:
+            return [http_response("404 Not Found", NOT_FOUND_BODY, keep_alive=keep_alive)]
+        stat_result = indexed.stat
+    else:
+        try:
+            stat_result = os.stat(file_path)
+        except OSError:
+            return [http_response("404 Not Found", NOT_FOUND_BODY, keep_alive=keep_alive)]
+
+    # Handle directory requests
+    if stat.S_ISDIR(stat_result.st_mode):
+        params = urllib.parse.parse_qs(query)
+        if "archive" in params:
+            archive_format = params["archive"][0]
+            if archive_format not in ARCHIVE_TYPES:
+                return [http_response("400 Bad Request", BAD_REQUEST_BODY, keep_alive=keep_alive)]
+            # Resolve symlinks too: an archive walks everything below the directory
+            if not inside_root(os.path.realpath(file_path), os.path.realpath(base_dir)):
+                return [http_response("404 Not Found", NOT_FOUND_BODY, keep_alive=keep_alive)]
+            increment_counter(file_path, use_lock)
+            return archive_response(request, file_path, archive_format, use_lock, keep_alive)
+        try:
+            offset, limit = listing_page(params)
+        except ValueError:
+            return [http_response("400 Bad Request", BAD_REQUEST_BODY, keep_alive=keep_alive)]
+        if offset and offset >= len(listing_index(file_path, path, stat_result)[1]):
+            # No such page; an empty directory still has its (empty) first one
+            return [http_response("404 Not Found", NOT_FOUND_BODY, keep_alive=keep_alive)]
         increment_counter(file_path, use_lock)
+        return listing_response(request, file_path, path, stat_result, offset, limit, keep_alive)
+
+    # Hot files are answered from memory without opening the file
+    entry = content_cache.get(file_path, stat_result)
+    if entry is not None:
+        mime_type = entry.content_type
+    else:
+        # Check MIME type
+        mime_type = indexed.content_type if indexed is not None else served_type(file_path)
+        if mime_type not in SERVED_TYPES:
+            return [http_response("404 Not Found", NOT_FOUND_BODY, keep_alive=keep_alive)]
+
+    # Increment counter for this file
+    increment_counter(file_path, use_lock)
 
-        # Serve the file
-        with open(file_path, "rb") as f:
-            body = f.read()
+    # Content negotiation: a fresh .gz sibling wins, text is compressed in memory
+    use_gzip = False
+    extra_headers = []
+    if mime_type not in INCOMPRESSIBLE_TYPES:
+        compressible = mime_type in COMPRESSIBLE_TYPES
+        use_gzip = accepts_gzip(request)
+        sibling = None
+        if use_gzip or not compressible:
+            # Without a sibling only compressible types vary by encoding
+            sibling = precompressed_sibling(file_path, stat_result)
+        if compressible or sibling is not None:
+            extra_headers.append(VARY_ACCEPT_ENCODING)
+        if use_gzip and sibling is not None:
+            sibling_path, sibling_stat = sibling
+            return file_response(request, sibling_stat, mime_type, sibling_path, keep_alive,
+                                 extra_headers=[*extra_headers, CONTENT_ENCODING_GZIP])
+        use_gzip = use_gzip and compressible
 
-        header = f"HTTP/1.1 200 OK\r\nContent-Type: {mime_type}\r\nContent-Length: {len(body)}\r\n\r\n"
-        conn.sendall(header.encode("utf-8") + body)
+    if entry is None and content_cache.cacheable(stat_result.st_size):
+        # Small files are read once and kept in the cache
+        file_stat, body = read_file(file_path)
+        head = status_headers("200 OK", len(body), mime_type,
+                              ["Accept-Ranges: bytes", *validator_headers(file_etag(file_stat), file_stat)])
+        entry = CacheEntry(file_stat.st_mtime_ns, file_stat.st_size, head, body, mime_type)
+        if len(body) == file_stat.st_size:
+            content_cache.put(file_path, file_stat, head, body, mime_type)
+        stat_result = file_stat
 
+    if entry is None:
+        # Larger files are streamed from disk, never read into memory
+        head = indexed.head if indexed is not None else None
+        return file_response(request, stat_result, mime_type, file_path, keep_alive, head, extra_headers=extra_headers)
+
+    if use_gzip and len(entry.body) >= GZIP_MIN_SIZE:
+        gzip_entry = gzip_cache_entry(file_path, stat_result, mime_type, entry.body)
+        return file_response(request, stat_result, mime_type, gzip_entry.body, keep_alive, gzip_entry.head,
+                             gzip_etag(file_etag(stat_result)), [*extra_headers, CONTENT_ENCODING_GZIP])
+    return file_response(request, stat_result, mime_type, entry.body, keep_alive, entry.head,
+                         extra_headers=extra_headers)
+
+
+def listing_response(request, directory, request_path, stat_result, offset, limit, keep_alive):
+    """Parts answering a directory request: one page of the listing, as HTML or JSON.
+
+    Pages of more than LISTING_STREAM_ROWS entries are streamed with
+    chunked encoding, except to HTTP/1.0 clients, which cannot decode it.
+    Listings carry no validators and are never answered 304: the live
+    request counts, the directory's own included, change with every view.
+    """
+    as_json = wants_json(request)
+    use_gzip = accepts_gzip(request)
+    content_type = "application/json" if as_json else "text/html"
+    extra_headers = [VARY_LISTING, CACHE_CONTROL_NO_CACHE]
+    if use_gzip:
+        extra_headers.append(CONTENT_ENCODING_GZIP)
+
+    if (request.version != "HTTP/1.0"
+            and listing_page_rows(directory, request_path, stat_result, offset, limit) > LISTING_STREAM_ROWS):
+        chunks = listing_chunks(directory, request_path, stat_result, offset, limit, as_json)
+        if use_gzip:
+            chunks = gzip_stream(chunks, GZIP_DYNAMIC_LEVEL)
+        return [http_head("200 OK", None, content_type, keep_alive, extra_headers), ChunkedBody(chunks)]
+
+    body = generate_directory_listing(directory, request_path, stat_result, offset, limit, as_json)
+    if use_gzip:
+        body = gzip_compress(body, GZIP_DYNAMIC_LEVEL)
+    return [http_head("200 OK", len(body), content_type, keep_alive, extra_headers) + body]
+
+
+def archive_members(directory):
+    """(path, arcname) of every served file under `directory`.
+
+    Archive names start with the directory's own name. os.walk does not
+    follow symlinked directories, so the walk cannot leave the tree
+    through one; the manifest would, since it indexes them.
+    """
+    prefix = os.path.basename(directory) or "root"
+    for root, dirs, files in os.walk(directory):
+        dirs.sort()
+        for name in sorted(files):
+            path = os.path.join(root, name)
+            if served_type(path) is not None:
+                yield path, prefix + "/" + os.path.relpath(path, directory).replace(os.sep, "/")
+
+
+def archive_response(request, directory, archive_format, use_lock, keep_alive):
+    """Parts answering ?archive=tar or ?archive=zip: the whole subtree, built while it is sent.
+
+    Memory stays at one file read (archive.READ_SIZE) however large the
+    tree, and every included file counts as a request for it. HTTP/1.0
+    clients get the same stream ended by closing the connection.
+    """
+    count_file = functools.partial(increment_counter, use_lock=use_lock)
+    members = archive_members(directory)
+    if archive_format == "zip":
+        chunks = zip_stream(members, count_file, lambda path: mimetypes.guess_type(path)[0] in COMPRESSIBLE_TYPES)
+    else:
+        chunks = tar_stream(members, count_file)
+    name = "".join(c if c.isalnum() or c in "-_." else "_" for c in os.path.basename(directory)) or "root"
+    framed = request.version != "HTTP/1.0"
+    head = status_headers("200 OK", None, ARCHIVE_TYPES[archive_format],
+                          [f'Content-Disposition: attachment; filename="{name}.{archive_format}"'], chunked=framed)
+    return [head + connection_header(keep_alive and framed), ChunkedBody(chunks, framed)]
+
+
+def sync_manifest(base_dir):
+    """The index SYNC_MANIFEST_PATH is served from, built on first use unless --manifest built one.
+
+    From then on its refresher also re-stats files, so edits made in place
+    show up within MANIFEST_REFRESH seconds.
+    """
+    global sync_index
+    if sync_index is None:
+        with sync_index_lock:
+            if sync_index is None:
+                index = manifest
+                if index is None:
+                    index = Manifest(base_dir, refresh_interval=MANIFEST_REFRESH)
+                    seconds = index.build()
+                    print(f"Sync manifest: indexed {index.stats()['files']} files in {seconds * 1000:.1f} ms")
+                index.track_files()
+                index.start_refresher()
+                sync_index = index
+    return sync_index
+
+
+def index_url_path(index, path):
+    """URL path of an indexed file system path."""
+    relative = path[len(index.root.rstrip(os.sep)):].replace(os.sep, "/")
+    return relative or "/"
+
+
+def sync_manifest_chunks(index, top, since):
+    """The JSON manifest of `top`, encoded, in chunks of LISTING_BATCH_ROWS entries.
+
+    Lists directories and served files whose mtime is at least `since`;
+    a newer directory mtime means entries were added or removed in it.
+    `indexed_at` is the time the index reflects the disk as of, to pass
+    as `since` on the next poll. Entries are formatted directly rather
+    than with json.dumps, which would dominate the cost.
+    """
+    root = index_url_path(index, top)
+    if stat.S_ISDIR(index.lookup(top).stat.st_mode):
+        root = root.rstrip("/") + "/"
+    head = {"root": root, "since": since, "indexed_at": index.indexed_at}
+    yield (json.dumps(head, separators=(",", ":"))[:-1] + ',"entries":[').encode("utf-8")
+    strip = len(index.root.rstrip(os.sep))
+    items = []
+    separator = ""
+    for path, entry in index.walk(top):
+        stat_result = entry.stat
+        mtime = stat_result.st_mtime
+        if since is not None and mtime < since:
+            continue
+        url_path = path[strip:].replace(os.sep, "/")
+        if stat.S_ISDIR(stat_result.st_mode):
+            items.append(f'{{"path":{encode_basestring_ascii(url_path + "/")},"type":"directory",'
+                         f'"size":null,"mtime":{mtime!r},"etag":null}}')
+        elif entry.content_type in SERVED_TYPES:
+            items.append(f'{{"path":{encode_basestring_ascii(url_path)},"type":"file",'
+                         f'"size":{stat_result.st_size},"mtime":{mtime!r},'
+                         f'"etag":{encode_basestring_ascii(file_etag(stat_result))}}}')
+        if len(items) == LISTING_BATCH_ROWS:
+            yield (separator + ",".join(items)).encode("utf-8")
+            items = []
+            separator = ","
+    if items:
+        yield (separator + ",".join(items)).encode("utf-8")
+    yield b"]}"
+
+
+def sync_manifest_response(request, base_dir, subtree, query, keep_alive):
+    """Parts answering SYNC_MANIFEST_PATH: the manifest of one subtree, streamed from the index."""
+    params = urllib.parse.parse_qs(query)
+    try:
+        since = float(params["since"][0]) if "since" in params else None
+    except ValueError:
+        return [http_response("400 Bad Request", BAD_REQUEST_BODY, keep_alive=keep_alive)]
+    index = sync_manifest(base_dir)
+    top = normalize_path(os.path.join(index.root, subtree.lstrip("/")))
+    if index.lookup(top) is None:  # Also refuses paths that climb out of the root
+        return [http_response("404 Not Found", NOT_FOUND_BODY, keep_alive=keep_alive)]
+
+    chunks = sync_manifest_chunks(index, top, since)
+    use_gzip = accepts_gzip(request)
+    extra_headers = [VARY_ACCEPT_ENCODING, CACHE_CONTROL_NO_CACHE]
+    if use_gzip:
+        chunks = gzip_stream(chunks, GZIP_DYNAMIC_LEVEL)
+        extra_headers.append(CONTENT_ENCODING_GZIP)
+    if request.version == "HTTP/1.0":
+        body = b"".join(chunks)
+        return [http_head("200 OK", len(body), "application/json", keep_alive, extra_headers) + body]
+    return [http_head("200 OK", None, "application/json", keep_alive, extra_headers), ChunkedBody(chunks)]
+
+
+def read_file(file_path):
+    """Read a whole file; returns (stat, body) with the stat taken from the open file."""
+    with open(file_path, "rb") as f:
+        return os.fstat(f.fileno()), f.read()
+
+
+def file_head(stat_result, content_type):
+    """Prebuilt 200 head of a file the server would serve, for the manifest; None for other files."""
+    if content_type not in SERVED_TYPES:
+        return None
+    return status_headers("200 OK", stat_result.st_size, content_type,
+                          ["Accept-Ranges: bytes", *validator_headers(file_etag(stat_result), stat_result)])
+
+
+def build_manifest(base_dir):
+    """Index `base_dir` into the global `manifest` and report what it cost."""
+    global manifest
+    manifest = Manifest(base_dir, file_head, MANIFEST_REFRESH)
+    seconds = manifest.build()
+    info = manifest.stats()
+    print(f"Manifest: indexed {info['files']} files in {info['directories']} directories in {seconds * 1000:.1f} ms"
+          f", refreshed every {MANIFEST_REFRESH}s")
+
+
+def file_response(request, stat_result, content_type, source, keep_alive, head=None, etag=None, extra_headers=()):
+    """Parts answering a file request, whole or by byte range.
+
+    `source` is the body as bytes (cached) or the file path (streamed);
+    `head` is the prebuilt 200 status head when one exists. `etag`
+    defaults to the file's own; `extra_headers` (Vary, Content-Encoding)
+    are added to every response, since cached heads do not carry them.
+    """
+    if etag is None:
+        etag = file_etag(stat_result)
+    if is_not_modified(request, etag, stat_result):
+        return [not_modified_response(etag, stat_result, keep_alive, extra_headers)]
+
+    size = len(source) if isinstance(source, bytes) else stat_result.st_size
+    range_header = request.headers.get("range")
+    if range_header is not None and if_range_matches(request, etag, stat_result):
+        ranges = parse_range_header(range_header, size)
+        if ranges is not None:
+            return range_response(ranges, size, content_type, source, keep_alive,
+                                  [*validator_headers(etag, stat_result), *extra_headers])
+
+    if head is None:
+        head = status_headers("200 OK", size, content_type,
+                              ["Accept-Ranges: bytes", *validator_headers(etag, stat_result)])
+    if extra_headers:
+        head += "".join(f"{line}\r\n" for line in extra_headers).encode("utf-8")
+    return [head + connection_header(keep_alive), body_slice(source, 0, size)]
+
+
+def without_empty_segments(parts):
+    """`parts` minus zero-length FileSegments (empty files), which sendfile refuses."""
+    return [part for part in parts if not isinstance(part, FileSegment) or part.count > 0]
+
+
+def send_response(conn, parts):
+    """Send response parts in order. Returns False if the connection must close: a file was cut short, or the body ends with it."""
+    parts = without_empty_segments(parts)
+    for index, part in enumerate(parts):
+        if isinstance(part, FileSegment):
+            # socket.sendfile uses os.sendfile when available and falls back
+            # to streaming the file in chunks otherwise.
+            with open(part.path, "rb") as f:
+                if conn.sendfile(f, part.offset, part.count) < part.count:
+                    return False
+        elif isinstance(part, ChunkedBody):
+            for chunk in part.encoded():
+                conn.sendall(chunk)
+            if not part.framed:
+                return False  # Only closing the connection ends the body
+        else:
+            conn.sendall(part, MSG_MORE if index + 1 < len(parts) else 0)
+    return True
+
+
+async def send_response_async(writer, parts):
+    """Asyncio counterpart of send_response."""
+    loop = asyncio.get_running_loop()
+    for part in without_empty_segments(parts):
+        if isinstance(part, FileSegment):
+            await writer.drain()
+            # loop.sendfile uses os.sendfile on plain sockets and falls back
+            # to chunked reads otherwise.
+            with open(part.path, "rb") as f:
+                if await loop.sendfile(writer.transport, f, part.offset, part.count) < part.count:
+                    return False
+        elif isinstance(part, ChunkedBody):
+            # Generating a chunk blocks the loop briefly; draining after each
+            # one keeps at most one chunk buffered per connection
+            for chunk in part.encoded():
+                writer.write(chunk)
+                await writer.drain()
+            if not part.framed:
+                return False
+        else:
+            writer.write(part)
+    await writer.drain()
+    return True
+
+
+def read_request(conn, parser):
+    """Read the next request from a blocking socket.
+
+    `parser` holds bytes already received; pipelined requests stay in it.
+    Returns None when the peer closed.
+    """
+    while True:
+        request = parser.next_request()
+        if request is not None:
+            return request
+        chunk = conn.recv(65536)
+        if not chunk:
+            return None
+        parser.feed(chunk)
+
+
+def log_access(client_ip, request, status, nbytes):
+    """Queue a served request for the access log, if one is enabled."""
+    if access_log is not None:
+        access_log.record(client_ip, request, status, nbytes)
+
+
+def respond(conn, client_ip, request, served, base_dir, use_lock=True, add_delay=False):
+    """Answer one request on a blocking socket. Returns True if the connection stays open."""
+    keep_alive = wants_keep_alive(request) and served < MAX_KEEP_ALIVE_REQUESTS
+
+    # Check rate limit
+    if not check_rate_limit(client_ip):
+        response = http_response("429 Too Many Requests", RATE_LIMITED_BODY, keep_alive=keep_alive)
+        conn.sendall(response)
+        metrics.record_response(429, len(response))
+        log_access(client_ip, request, 429, len(response))
+        return keep_alive
+
+    # Add delay to simulate work (for testing)
+    if add_delay:
+        time.sleep(1.0)
+    started = time.perf_counter_ns()
+    parts = build_response(request, base_dir, use_lock, keep_alive)
+    built = time.perf_counter_ns()
+    complete = send_response(conn, parts)
+    status, size = response_status(parts), response_size(parts)
+    metrics.record_response(status, size, built - started, time.perf_counter_ns() - built)
+    log_access(client_ip, request, status, size)
+    return keep_alive and complete
+
+
+def handle_client(conn, addr, base_dir, use_lock=True, add_delay=False):
+    """Serve requests on one connection until it closes, idles out or hits the request cap."""
+    client_ip = addr[0]
+    parser = new_request_parser()
+    served = 0
+    metrics.connection_opened()
+
+    try:
+        conn.settimeout(KEEP_ALIVE_TIMEOUT)
+        while True:
+            try:
+                request = read_request(conn, parser)
+            except BadRequest as e:
+                response = error_response(e)
+                conn.sendall(response)
+                metrics.record_response(response_status([response]), len(response))
+                log_access(client_ip, None, response_status([response]), len(response))
+                return
+            if request is None:
+                return
+
+            served += 1
+            if not respond(conn, client_ip, request, served, base_dir, use_lock, add_delay):
+                return
+
+    except socket.timeout:
+        pass  # Idle keep-alive connection
     except Exception as e:
         print(f"Error handling request from {client_ip}:", e)
     finally:
         conn.close()
+        metrics.connection_closed()
+
+
+async def read_request_async(reader, parser):
+    """Asyncio counterpart of read_request."""
+    while True:
+        request = parser.next_request()
+        if request is not None:
+            return request
+        chunk = await reader.read(65536)
+        if not chunk:
+            return None
+        parser.feed(chunk)
+
+
+async def handle_client_async(reader, writer, base_dir, use_lock=True, add_delay=False):
+    """Asyncio counterpart of handle_client: one coroutine per connection."""
+    client_ip = writer.get_extra_info("peername")[0]
+    parser = new_request_parser()
+    served = 0
+    metrics.connection_opened()
+
+    try:
+        while True:
+            try:
+                request = await asyncio.wait_for(read_request_async(reader, parser), KEEP_ALIVE_TIMEOUT)
+            except BadRequest as e:
+                response = error_response(e)
+                writer.write(response)
+                await writer.drain()
+                metrics.record_response(response_status([response]), len(response))
+                log_access(client_ip, None, response_status([response]), len(response))
+                return
+            if request is None:
+                return
+
+            served += 1
+            keep_alive = wants_keep_alive(request) and served < MAX_KEEP_ALIVE_REQUESTS
+
+            # Check rate limit
+            if not check_rate_limit(client_ip):
+                response = http_response("429 Too Many Requests", RATE_LIMITED_BODY, keep_alive=keep_alive)
+                writer.write(response)
+                await writer.drain()
+                metrics.record_response(429, len(response))
+                log_access(client_ip, request, 429, len(response))
+            else:
+                # Simulated work must not block the event loop
+                if add_delay:
+                    await asyncio.sleep(1.0)
+                # Filesystem work is short (local files, small listings), so it runs
+                # inline rather than paying a thread hand-off on every request.
+                started = time.perf_counter_ns()
+                parts = build_response(request, base_dir, use_lock, keep_alive)
+                built = time.perf_counter_ns()
+                complete = await send_response_async(writer, parts)
+                status, size = response_status(parts), response_size(parts)
+                metrics.record_response(status, size, built - started, time.perf_counter_ns() - built)
+                log_access(client_ip, request, status, size)
+                if not complete:
+                    return
+
+            if not keep_alive:
+                return
+
+    except asyncio.TimeoutError:
+        pass  # Idle keep-alive connection
+    except Exception as e:
+        print(f"Error handling request from {client_ip}:", e)
+    finally:
+        writer.close()
+        metrics.connection_closed()
 
 
-def run_server_threaded(base_dir, use_thread_pool=True, max_workers=10, use_lock=True, add_delay=False):
-    """Run server with threading support."""
+def run_server_serial(base_dir, use_lock=True, add_delay=False, port=PORT, reuse_port=False):
+    """Answer one connection at a time on the accepting thread, like the original server.py.
+
+    Each connection gets a single response: a keep-alive client idling
+    between requests would otherwise stall every other client.
+    """
+    global MAX_KEEP_ALIVE_REQUESTS
+    MAX_KEEP_ALIVE_REQUESTS = 1
+
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
         server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        server_socket.bind((HOST, PORT))
-        server_socket.listen(10)
+        if reuse_port:
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server_socket.bind((HOST, port))
+        server_socket.listen(LISTEN_BACKLOG)
 
-        mode = "thread pool" if use_thread_pool else "thread per request"
         lock_status = "WITH locks" if use_lock else "WITHOUT locks (naive)"
         delay_status = "with 1s delay" if add_delay else "no delay"
+        print(f"Serial server (one connection at a time, {lock_status}, {delay_status})")
+        print(f"Serving directory '{base_dir}' on http://localhost:{port}")
+        print(rate_limit_banner())
+        start_background_tasks()
 
-        print(f"Multithreaded server ({mode}, {lock_status}, {delay_status})")
-        print(f"Serving directory '{base_dir}' on http://localhost:{PORT}")
-        print(f"Rate limit: {MAX_REQUESTS_PER_SECOND} requests/second per IP")
+        while True:
+            conn, addr = server_socket.accept()
+            handle_client(conn, addr, base_dir, use_lock, add_delay)
+
+
+def rate_limit_banner():
+    """Startup line describing the rate limit."""
+    if MAX_REQUESTS_PER_SECOND <= 0:
+        return "Rate limit: rate limiting disabled"
+    return f"Rate limit: {MAX_REQUESTS_PER_SECOND} requests/second per IP (burst {rate_limiter.burst})"
 
+
+def start_background_tasks():
+    """Start the per-process helper threads of the enabled features; called by every backend after forking."""
+    rate_limiter.start_sweeper()
+    if manifest is not None:
+        manifest.start_refresher()
+    if profiler is not None:
+        profiler.start()
+        print(f"Profiling: per-stage timings and cProfile; kill -USR1 {os.getpid()} to dump")
+    if access_log is not None:
+        access_log.start()
+        print(f"Access log: {access_log.path} ({access_log.stats()['format']}, {access_log.drop_policy} when full)")
+
+
+def run_server_threaded(base_dir, use_thread_pool=True, max_workers=None, use_lock=True, add_delay=False, port=PORT,
+                        reuse_port=False, use_front_end=True):
+    """Run server with threading support.
+
+    In pool mode a selectors-based front end reads requests by default, so
+    workers only handle complete requests; use_front_end=False restores
+    the original blocking pool where each worker owns a connection.
+    The pool holds MIN_WORKERS to `max_workers` (default MAX_WORKERS) threads.
+    """
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if reuse_port:
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+        server_socket.bind((HOST, port))
+        server_socket.listen(LISTEN_BACKLOG)
+
+        if not use_thread_pool:
+            mode = "thread per request"
+        elif use_front_end:
+            mode = "thread pool, selector front end"
+        else:
+            mode = "thread pool, blocking"
+        lock_status = "WITH locks" if use_lock else "WITHOUT locks (naive)"
+        delay_status = "with 1s delay" if add_delay else "no delay"
+
+        print(f"Multithreaded server ({mode}, {lock_status}, {delay_status})")
+        print(f"Serving directory '{base_dir}' on http://localhost:{port}")
+        print(rate_limit_banner())
+        print(f"Keep-alive: {KEEP_ALIVE_TIMEOUT}s idle timeout, {MAX_KEEP_ALIVE_REQUESTS} requests per connection")
+        print(f"Listen backlog: {LISTEN_BACKLOG}" + (f", pending queue: {MAX_PENDING} (503 when full)" if use_thread_pool else ""))
         if use_thread_pool:
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            print(f"Worker pool: {MIN_WORKERS}-{max_workers or MAX_WORKERS} threads, idle threads retire after {WORKER_IDLE_TIMEOUT}s")
+
+        start_background_tasks()
+
+        if use_thread_pool and use_front_end:
+            raise_open_file_limit()
+            print(f"Timeouts: {HEADER_TIMEOUT}s header read, {SEND_TIMEOUT}s send, {KEEP_ALIVE_TIMEOUT}s idle")
+
+            def handler(conn, addr, request, served):
+                return respond(conn, addr[0], request, served, base_dir, use_lock)
+
+            with start_pool(max_workers) as executor:
+                front_end = SelectorFrontEnd(
+                    server_socket, start_admission(executor), new_request_parser, handler,
+                    error_response, overloaded_response(),
+                    HEADER_TIMEOUT, KEEP_ALIVE_TIMEOUT, SEND_TIMEOUT,
+                    delay=1.0 if add_delay else 0.0, metrics=metrics, log_access=log_access,
+                )
+                front_end.serve_forever()
+        elif use_thread_pool:
+            with start_pool(max_workers) as executor:
+                pool = start_admission(executor)
                 while True:
                     conn, addr = server_socket.accept()
-                    executor.submit(handle_client, conn, addr, base_dir, use_lock, add_delay)
+                    if not pool.try_submit(handle_client, conn, addr, base_dir, use_lock, add_delay):
+                        reject_overloaded(conn, addr)
         else:
             while True:
                 conn, addr = server_socket.accept()
@@ -215,13 +1430,254 @@ def run_server_threaded(base_dir, use_thread_pool=True, max_workers=10, use_lock
                 thread.start()
 
 
+def start_pool(max_workers=None):
+    """Create the adaptive worker pool; installed as the global `worker_pool`."""
+    global worker_pool
+    worker_pool = AdaptiveThreadPool(min(MIN_WORKERS, max_workers or MAX_WORKERS), max_workers or MAX_WORKERS,
+                                     WORKER_IDLE_TIMEOUT)
+    metrics.register_gauge("http_pool_threads", "Worker threads currently in the pool.", worker_pool.size)
+    return worker_pool
+
+
+def start_admission(executor):
+    """Bound the executor's queue and record queue wait; installed as the global `admission`."""
+    global admission
+    if profiler is not None:
+        def on_wait(waited_ns):
+            metrics.observe("queue", waited_ns)
+            profiler.add("queue", waited_ns)
+    else:
+        def on_wait(waited_ns):
+            metrics.observe("queue", waited_ns)
+    admission = AdmissionControl(executor, MAX_PENDING, on_wait)
+    metrics.register_gauge("http_executor_queue_depth", "Work items waiting for a pool thread.", admission.pending)
+    return admission
+
+
+def reject_overloaded(conn, addr):
+    """Answer 503 on a connection the pool has no room for, then close it."""
+    response = overloaded_response()
+    sent = 0
+    try:
+        conn.settimeout(1.0)
+        conn.sendall(response)
+        sent = len(response)
+        metrics.record_response(503, sent)
+    except OSError:
+        pass
+    finally:
+        conn.close()
+        # The request was never read, so only the client is known
+        log_access(addr[0], None, 503, sent)
+
+
+def raise_open_file_limit():
+    """Raise the soft file descriptor limit so one process can hold thousands of sockets."""
+    try:
+        import resource
+    except ImportError:  # Not available on Windows
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > soft:
+        target = hard if hard != resource.RLIM_INFINITY else 65536
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (target, hard))
+        except (ValueError, OSError):
+            pass
+
+
+async def serve_async(base_dir, use_lock=True, add_delay=False, port=PORT, reuse_port=False):
+    """Accept connections on the event loop; each one is served by a coroutine."""
+    async def on_connect(reader, writer):
+        await handle_client_async(reader, writer, base_dir, use_lock, add_delay)
+
+    server = await asyncio.start_server(
+        on_connect, HOST, port, reuse_address=True, reuse_port=reuse_port or None,
+        backlog=ASYNC_BACKLOG
+    )
+    async with server:
+        await server.serve_forever()
+
+
+def run_server_async(base_dir, use_lock=True, add_delay=False, port=PORT, reuse_port=False):
+    """Run server on a single asyncio event loop."""
+    raise_open_file_limit()
+    start_background_tasks()
+
+    lock_status = "WITH locks" if use_lock else "WITHOUT locks (naive)"
+    delay_status = "with 1s delay" if add_delay else "no delay"
+
+    print(f"Asyncio server ({lock_status}, {delay_status})")
+    print(f"Serving directory '{base_dir}' on http://localhost:{port}")
+    print(rate_limit_banner())
+    print(f"Keep-alive: {KEEP_ALIVE_TIMEOUT}s idle timeout, {MAX_KEEP_ALIVE_REQUESTS} requests per connection")
+
+    if profiler is not None:
+        # The event loop runs every request, so its thread is profiled as a whole
+        profiler.profile_current_thread()
+    try:
+        asyncio.run(serve_async(base_dir, use_lock, add_delay, port, reuse_port))
+    except KeyboardInterrupt:
+        pass
+
+
+def run_prefork_worker(serve, kwargs):
+    """Entry point of one forked worker process."""
+    # Metrics and stats are per process; say which one answered
+    constant_labels.update(worker=multiprocessing.current_process().name, pid=os.getpid())
+    # The parent's SIGTERM handler is inherited through fork; workers just exit
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    # The parent's SIGUSR1 handler forwards the signal; workers dump their own profile
+    if profiler is not None and hasattr(signal, "SIGUSR1"):
+        signal.signal(signal.SIGUSR1, dump_profile)
+    if access_log is not None:
+        # Exit through atexit so the buffered access log is flushed
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+        if access_log.path != "-":
+            # Each process rotates its own file
+            access_log.path += "." + multiprocessing.current_process().name
+    try:
+        serve(**kwargs)
+    except KeyboardInterrupt:
+        pass
+
+
+def counter_slots():
+    """Slots of the shared counter table: --counter-slots, else twice the paths in the manifest, at least the default."""
+    if COUNTER_SLOTS > 0:
+        return COUNTER_SLOTS
+    indexed = manifest.stats()["files"] + manifest.stats()["directories"] if manifest is not None else 0
+    return max(DEFAULT_COUNTER_SLOTS, 2 * indexed)
+
+
+def run_server_prefork(base_dir, workers, serve, use_lock=True, add_delay=False, port=PORT):
+    """Fork `workers` processes that each bind the port with SO_REUSEPORT and run the `serve` backend.
+
+    Request counters and rate-limit state are moved into shared memory
+    before forking, so listings and the per-IP limit stay global.
+    """
+    global request_counter, rate_limiter
+
+    if not hasattr(socket, "SO_REUSEPORT"):
+        print("Error: --workers requires SO_REUSEPORT, which this platform does not provide")
+        sys.exit(1)
+
+    slots = counter_slots()
+    request_counter = SharedCounter(COUNTER_STRIPES, -(-slots // COUNTER_STRIPES))
+    rate_limiter = SharedRateLimiter(MAX_REQUESTS_PER_SECOND, RATE_LIMIT_BURST)
+
+    kwargs = {"base_dir": base_dir, "use_lock": use_lock, "add_delay": add_delay, "port": port, "reuse_port": True}
+
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=run_prefork_worker, args=(serve, kwargs), name=f"worker-{n}", daemon=True)
+        for n in range(workers)
+    ]
+
+    print(f"Prefork server: {workers} worker processes sharing port {port} (SO_REUSEPORT)")
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if profiler is not None and hasattr(signal, "SIGUSR1"):
+        # Every worker dumps its own profile
+        signal.signal(signal.SIGUSR1, lambda signum, frame: [os.kill(p.pid, signal.SIGUSR1) for p in processes if p.pid])
+    try:
+        for process in processes:
+            process.start()
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        for process in processes:
+            process.join()
+        request_counter.release()
+        rate_limiter.release()
+
+
+def dump_profile(signum, frame):
+    """SIGUSR1 handler: print the per-stage breakdown and write the merged cProfile stats."""
+    profiler.dump()
+
+
+def enable_profiling(output_dir):
+    """Install the global `profiler` and wrap the timed stages and request handling."""
+    global profiler, respond
+    profiler = Profiler(output_dir)
+    profiler.instrument(globals(), PROFILE_STAGES)
+    respond = profiler.profiled(respond)
+
+
+# Concurrency backends, all serving the same request pipeline; each is
+# called as backend(base_dir, use_lock=, add_delay=, port=, reuse_port=)
+BACKENDS = {
+    "serial": run_server_serial,
+    "thread": functools.partial(run_server_threaded, use_thread_pool=False),
+    "blocking-pool": functools.partial(run_server_threaded, use_front_end=False),
+    "pool": run_server_threaded,
+    "async": run_server_async,
+}
+
+
+def backend_from_flags():
+    """Backend named by --backend, or by the older --serial/--no-pool/--blocking-pool/--async flags."""
+    name = get_option_value("--backend", None, str)
+    if name is not None:
+        return name
+    for flag, name in (("--serial", "serial"), ("--async", "async"), ("--no-pool", "thread"),
+                       ("--blocking-pool", "blocking-pool")):
+        if flag in sys.argv:
+            return name
+    return "pool"
+
+
+def get_option_value(name, default, cast=int):
+    """Return the value that follows a CLI option such as '--port 8081'."""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return cast(sys.argv[index + 1])
+    return default
+
+
 if __name__ == "__main__":
     if len(sys.argv) < 2:
         print("Usage: python server_multithreaded.py <directory_to_serve> [options]")
         print("Options:")
-        print("  --no-pool          Use thread-per-request instead of thread pool")
+        print(f"  --backend NAME     Concurrency backend: {', '.join(BACKENDS)} (default: pool)")
+        print("  --serial           Same as --backend serial: one connection at a time")
+        print("  --no-pool          Same as --backend thread: a thread per connection")
+        print("  --blocking-pool    Same as --backend blocking-pool: pool workers read their own sockets")
+        print("  --async            Same as --backend async: all connections on one asyncio event loop")
         print("  --no-lock          Disable locks (show race condition)")
         print("  --delay            Add 1s delay to simulate work")
+        print("  --workers N        Fork N worker processes sharing the port via SO_REUSEPORT")
+        print("  --counter-slots N  Paths the shared counter table of --workers holds (default: 65536, or 2x the manifest)")
+        print("  --port N           Listen on port N (default: 8080)")
+        print("  --rate-limit N     Requests/second allowed per IP, 0 disables (default: 5)")
+        print("  --burst N          Requests a client may send at once before being limited (default: the rate)")
+        print("  --cache-mb N       Memory budget for the hot-file cache in MB, 0 disables (default: 64)")
+        print("  --keep-alive-timeout S  Close idle persistent connections after S seconds (default: 5)")
+        print("  --max-keep-alive N      Requests served per connection before closing (default: 100)")
+        print("  --header-timeout S      Seconds to receive a complete request head (default: 10)")
+        print("  --send-timeout S        Seconds a response write may stall (default: 30)")
+        print("  --backlog N        Listen backlog of the server socket (default: 128, 1024 with --async)")
+        print("  --max-pending N    Requests allowed to wait for a pool worker before 503 (default: 128)")
+        print("  --min-workers N    Pool threads kept even when idle (default: 4)")
+        print("  --max-workers N    Pool threads started at most under load (default: 64)")
+        print("  --worker-idle S    Seconds before an idle thread above the minimum exits (default: 10)")
+        print("  --manifest         Index the served tree at startup; lookups and 404s skip the disk")
+        print("  --manifest-refresh S  Seconds between checks of the indexed directories (default: 2)")
+        print("  --profile          Time each request stage and collect cProfile data; dump with SIGUSR1")
+        print("  --profile-dir DIR  Where SIGUSR1 writes profile-<pid>-<time>.pstats (default: .)")
+        print("  --access-log PATH  Write an access log to PATH, or - for stdout (default: off)")
+        print("  --access-log-format common|combined  Log format (default: combined)")
+        print("  --access-log-max-mb N   Rotate when the log would exceed N MB, 0 disables (default: 64)")
+        print("  --access-log-rotate S   Also rotate every S seconds, 0 disables (default: 0)")
+        print("  --access-log-backups N  Rotated files kept as PATH.1 ... PATH.N (default: 5)")
+        print("  --access-log-buffer N   Records buffered for the writer thread (default: 8192)")
+        print("  --access-log-policy P   When the buffer is full: drop-newest, drop-oldest or block (default: drop-newest)")
         sys.exit(1)
 
     directory = sys.argv[1]
@@ -229,8 +1685,57 @@ if __name__ == "__main__":
         print(f"Error: '{directory}' is not a directory")
         sys.exit(1)
 
-    use_pool = "--no-pool" not in sys.argv
+    backend = backend_from_flags()
+    if backend not in BACKENDS:
+        print(f"Error: unknown backend '{backend}'; choose from {', '.join(BACKENDS)}")
+        sys.exit(1)
     use_lock = "--no-lock" not in sys.argv
     add_delay = "--delay" in sys.argv
+    workers = get_option_value("--workers", 0)
+    port = get_option_value("--port", PORT)
+    MAX_REQUESTS_PER_SECOND = get_option_value("--rate-limit", MAX_REQUESTS_PER_SECOND, float)
+    RATE_LIMIT_BURST = get_option_value("--burst", max(1, int(MAX_REQUESTS_PER_SECOND)))
+    rate_limiter = RateLimiter(MAX_REQUESTS_PER_SECOND, RATE_LIMIT_BURST)
+    KEEP_ALIVE_TIMEOUT = get_option_value("--keep-alive-timeout", KEEP_ALIVE_TIMEOUT, float)
+    MAX_KEEP_ALIVE_REQUESTS = get_option_value("--max-keep-alive", MAX_KEEP_ALIVE_REQUESTS)
+    HEADER_TIMEOUT = get_option_value("--header-timeout", HEADER_TIMEOUT, float)
+    SEND_TIMEOUT = get_option_value("--send-timeout", SEND_TIMEOUT, float)
+    CACHE_MAX_BYTES = get_option_value("--cache-mb", CACHE_MAX_BYTES // (1024 * 1024)) * 1024 * 1024
+    content_cache = ContentCache(CACHE_MAX_BYTES, CACHE_MAX_ENTRY_BYTES)
+    LISTEN_BACKLOG = get_option_value("--backlog", LISTEN_BACKLOG)
+    ASYNC_BACKLOG = get_option_value("--backlog", ASYNC_BACKLOG)
+    MAX_PENDING = get_option_value("--max-pending", MAX_PENDING)
+    MIN_WORKERS = get_option_value("--min-workers", MIN_WORKERS)
+    MAX_WORKERS = get_option_value("--max-workers", MAX_WORKERS)
+    WORKER_IDLE_TIMEOUT = get_option_value("--worker-idle", WORKER_IDLE_TIMEOUT, float)
+    MANIFEST_REFRESH = get_option_value("--manifest-refresh", MANIFEST_REFRESH, float)
+    COUNTER_SLOTS = get_option_value("--counter-slots", COUNTER_SLOTS)
+    if "--profile" in sys.argv:
+        enable_profiling(get_option_value("--profile-dir", ".", str))
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, dump_profile)
+    access_log_path = get_option_value("--access-log", None, str)
+    access_log_policy = get_option_value("--access-log-policy", "drop-newest", str)
+    if access_log_policy not in DROP_POLICIES:
+        print(f"Error: --access-log-policy must be one of {', '.join(DROP_POLICIES)}")
+        sys.exit(1)
+    if access_log_path is not None:
+        access_log = AccessLog(
+            access_log_path,
+            combined=get_option_value("--access-log-format", "combined", str) == "combined",
+            capacity=get_option_value("--access-log-buffer", 8192),
+            max_bytes=get_option_value("--access-log-max-mb", 64) * 1024 * 1024,
+            rotate_seconds=get_option_value("--access-log-rotate", 0, float),
+            backups=get_option_value("--access-log-backups", 5),
+            drop_policy=access_log_policy,
+        )
+        # Exit through atexit on SIGTERM so the buffered records are flushed
+        signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    if "--manifest" in sys.argv:
+        # Built before forking, so --workers processes share the index
+        build_manifest(directory)
 
-    run_server_threaded(directory, use_thread_pool=use_pool, use_lock=use_lock, add_delay=add_delay)
+    if workers > 0:
+        run_server_prefork(directory, workers, BACKENDS[backend], use_lock=use_lock, add_delay=add_delay, port=port)
+    else:
+        BACKENDS[backend](directory, use_lock=use_lock, add_delay=add_delay, port=port)
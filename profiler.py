@@ -0,0 +1,195 @@
+import cProfile
+import functools
+import inspect
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+
+# Before 3.12 every thread can run its own cProfile profiler. From 3.12 on
+# profilers hook sys.monitoring: only one may be active per process, and
+# it sees the calls of every thread.
+PER_THREAD_PROFILERS = sys.version_info < (3, 12)
+
+
+class _Snapshot:
+    """Stats captured from a profiler without disabling it, in the form pstats.Stats loads."""
+
+    def __init__(self, profiler):
+        profiler.snapshot_stats()
+        self.stats = profiler.stats
+
+    def create_stats(self):
+        pass
+
+
+class Profiler:
+    """Per-stage timings and cProfile data for --profile mode.
+
+    Stage timings go into one dict per thread, so recording takes no lock;
+    the dicts are only summed when a report is made. Functions are timed
+    by replacing them with wrappers (instrument()), so nothing is measured,
+    and nothing costs anything, unless the mode is on. profiled() runs a
+    function under the calling thread's own cProfile profiler, or under
+    one process-wide profiler on Python 3.12+, and dump() merges all of
+    them into a single pstats file.
+    """
+
+    def __init__(self, output_dir="."):
+        self.output_dir = output_dir
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._accumulators = []
+        self._profilers = []
+        self._shared = None
+        self.started = time.time()
+
+    def start(self):
+        """Start the process-wide profiler where per-thread ones are not possible."""
+        if not PER_THREAD_PROFILERS and self._shared is None:
+            self._shared = cProfile.Profile()
+            self._shared.enable()
+
+    def _accumulator(self):
+        try:
+            return self._local.stages
+        except AttributeError:
+            stages = self._local.stages = {}
+            with self._lock:
+                self._accumulators.append(stages)
+            return stages
+
+    def add(self, stage, elapsed_ns):
+        """Record `elapsed_ns` spent in `stage` by the calling thread."""
+        stages = self._accumulator()
+        totals = stages.get(stage)
+        if totals is None:
+            stages[stage] = [1, elapsed_ns, elapsed_ns]
+        else:
+            totals[0] += 1
+            totals[1] += elapsed_ns
+            if elapsed_ns > totals[2]:
+                totals[2] = elapsed_ns
+
+    def timed(self, stage, fn):
+        """Wrap `fn` (a function or coroutine function) so every call is added to `stage`."""
+        if inspect.iscoroutinefunction(fn):
+            @functools.wraps(fn)
+            async def wrapper(*args, **kwargs):
+                started = time.perf_counter_ns()
+                try:
+                    return await fn(*args, **kwargs)
+                finally:
+                    self.add(stage, time.perf_counter_ns() - started)
+        else:
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                started = time.perf_counter_ns()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    self.add(stage, time.perf_counter_ns() - started)
+        return wrapper
+
+    def instrument(self, namespace, stages):
+        """Replace the functions named in `stages`, (stage, function name) pairs, in `namespace` with timed ones."""
+        for stage, name in stages:
+            namespace[name] = self.timed(stage, namespace[name])
+
+    def _thread_profiler(self):
+        try:
+            return self._local.profiler
+        except AttributeError:
+            profiler = self._local.profiler = cProfile.Profile()
+            with self._lock:
+                self._profilers.append(profiler)
+            return profiler
+
+    def profiled(self, fn):
+        """Wrap `fn` so each call runs under the calling thread's cProfile profiler."""
+        if not PER_THREAD_PROFILERS:
+            return fn  # The process-wide profiler already sees every thread
+
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            profiler = self._thread_profiler()
+            profiler.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profiler.disable()
+        return wrapper
+
+    def profile_current_thread(self):
+        """Profile everything the calling thread runs from now on (the asyncio loop thread)."""
+        if PER_THREAD_PROFILERS:
+            self._thread_profiler().enable()
+
+    def stage_totals(self):
+        """{stage: [calls, total_ns, max_ns]} summed over all threads."""
+        merged = {}
+        with self._lock:
+            accumulators = list(self._accumulators)
+        for stages in accumulators:
+            for stage, (calls, total_ns, max_ns) in list(stages.items()):
+                totals = merged.setdefault(stage, [0, 0, 0])
+                totals[0] += calls
+                totals[1] += total_ns
+                totals[2] = max(totals[2], max_ns)
+        return merged
+
+    def stage_stats(self):
+        """Per-stage breakdown as JSON-friendly dicts, for /__stats."""
+        return {
+            stage: {
+                "calls": calls,
+                "total_ms": round(total_ns / 1e6, 3),
+                "mean_us": round(total_ns / calls / 1e3, 3),
+                "max_us": round(max_ns / 1e3, 3),
+            }
+            for stage, (calls, total_ns, max_ns) in sorted(self.stage_totals().items())
+        }
+
+    def report(self):
+        """Per-stage breakdown as printable lines."""
+        lines = [f"{'stage':<14}{'calls':>10}{'total ms':>12}{'mean us':>12}{'max us':>12}"]
+        for stage, (calls, total_ns, max_ns) in sorted(self.stage_totals().items(), key=lambda item: -item[1][1]):
+            lines.append(f"{stage:<14}{calls:>10}{total_ns / 1e6:>12.1f}{total_ns / calls / 1e3:>12.1f}{max_ns / 1e3:>12.1f}")
+        return lines
+
+    def dump(self, top=15):
+        """Print the stage breakdown and the hottest functions, and write the merged pstats file.
+
+        Returns the path of the pstats file, or None if no function calls were profiled yet.
+        """
+        print(f"=== Profile of process {os.getpid()}, {time.time() - self.started:.0f}s since start ===")
+        for line in self.report():
+            print(line)
+
+        with self._lock:
+            profilers = list(self._profilers)
+        if self._shared is not None:
+            profilers.append(self._shared)
+        stats = None
+        for profiler in profilers:
+            snapshot = _Snapshot(profiler)
+            if not snapshot.stats:
+                continue
+            if stats is None:
+                stats = pstats.Stats(snapshot)
+            else:
+                stats.add(snapshot)
+        if stats is None:
+            print("No function calls profiled yet")
+            return None
+
+        path = os.path.join(self.output_dir, f"profile-{os.getpid()}-{time.strftime('%Y%m%d-%H%M%S')}.pstats")
+        stats.dump_stats(path)
+        text = io.StringIO()
+        stats.stream = text
+        stats.sort_stats("tottime").print_stats(top)
+        print(text.getvalue().rstrip())
+        print(f"cProfile data from {len(profilers)} profiler(s) written to {path}")
+        return path
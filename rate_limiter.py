@@ -0,0 +1,85 @@
+import threading
+import time
+
+
+class RateLimiter:
+    """Per-client rate limiter using GCRA (the generic cell rate algorithm).
+
+    GCRA is a token bucket that stores a single float per client: the
+    "theoretical arrival time" (TAT) at which the client's bucket will be
+    full again. Each check is O(1). State is split across lock-striped
+    shards keyed by client IP, so concurrent clients rarely share a lock.
+
+    A client whose TAT is in the past has a full bucket, which behaves
+    exactly like having no entry at all. The background sweeper drops
+    those entries, so memory stays bounded by the clients seen in the
+    last few seconds no matter how many distinct IPs ever connect.
+    """
+
+    def __init__(self, rate, burst=None, num_shards=16, sweep_interval=5.0):
+        self.rate = rate
+        self.burst = burst if burst else max(1, int(rate))
+        self.sweep_interval = sweep_interval
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        # How far the TAT may run ahead of now and still admit a request
+        self._tolerance = self._interval * (self.burst - 1)
+        self._shards = [{} for _ in range(num_shards)]
+        self._locks = [threading.Lock() for _ in range(num_shards)]
+        self._rejected = [0] * num_shards
+        self._sweeper = None
+        self.evicted = 0
+
+    def allow(self, client_ip):
+        """Record a request from `client_ip`. Returns True if allowed, False if blocked."""
+        if self.rate <= 0:
+            return True
+        index = hash(client_ip) % len(self._shards)
+        shard = self._shards[index]
+        now = time.monotonic()
+        with self._locks[index]:
+            tat = shard.get(client_ip, now)
+            if tat < now:
+                tat = now
+            if tat - now > self._tolerance:
+                self._rejected[index] += 1
+                return False
+            shard[client_ip] = tat + self._interval
+            return True
+
+    def sweep(self):
+        """Drop clients whose bucket has refilled completely. Returns the number removed."""
+        removed = 0
+        for index, shard in enumerate(self._shards):
+            now = time.monotonic()
+            with self._locks[index]:
+                idle = [ip for ip, tat in shard.items() if tat <= now]
+                for ip in idle:
+                    del shard[ip]
+            removed += len(idle)
+        self.evicted += removed
+        return removed
+
+    def start_sweeper(self):
+        """Start the daemon thread that periodically evicts idle clients."""
+        if self._sweeper is not None or self.rate <= 0:
+            return
+
+        def run():
+            while True:
+                time.sleep(self.sweep_interval)
+                self.sweep()
+
+        self._sweeper = threading.Thread(target=run, name="rate-limit-sweeper", daemon=True)
+        self._sweeper.start()
+
+    def rejected_total(self):
+        return sum(self._rejected)
+
+    def stats(self):
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "tracked_clients": sum(len(shard) for shard in self._shards),
+            "rejected": self.rejected_total(),
+            "evicted": self.evicted,
+        }
@@ -0,0 +1,223 @@
+import hashlib
+import multiprocessing
+import struct
+import time
+from multiprocessing import shared_memory
+
+# Keys are stored as fixed-size digests so paths and IPs of any length fit a slot
+EMPTY_KEY = bytes(16)
+COUNTER_SLOT = struct.Struct("16sq")  # key digest, count
+RATE_SLOT = struct.Struct("16sd")  # key digest, theoretical arrival time
+REJECTED_SLOT = struct.Struct("q")
+
+
+def key_digest(key):
+    """16-byte digest of a string key, identical in every process (unlike hash())."""
+    return hashlib.blake2b(key.encode("utf-8", "surrogateescape"), digest_size=16).digest()
+
+
+def digest_index(digest):
+    return int.from_bytes(digest[:8], "little")
+
+
+class SharedCounter:
+    """Exact per-key counters in a shared-memory segment, usable from forked worker processes.
+
+    Drop-in replacement for counters.ShardedCounter in --workers mode. The
+    table is split into independent stripes, each an open-addressing hash
+    table guarded by its own process-shared lock, so processes counting
+    different files rarely wait for each other.
+
+    The segment cannot grow once workers have forked. A key that finds its
+    stripe full is not counted (it reads as 0); the first such key is
+    reported once per process and later ones are only tallied in
+    `uncounted`, so requests never fail because of the table.
+    """
+
+    def __init__(self, num_stripes=32, slots_per_stripe=2048):
+        context = multiprocessing.get_context("fork")
+        self._num_stripes = num_stripes
+        self._slots = slots_per_stripe
+        self._shm = shared_memory.SharedMemory(create=True, size=COUNTER_SLOT.size * num_stripes * slots_per_stripe)
+        self._buf = self._shm.buf
+        self._locks = [context.Lock() for _ in range(num_stripes)]
+        self.uncounted = 0  # Increments dropped by this process because a stripe was full
+
+    @property
+    def capacity(self):
+        return self._num_stripes * self._slots
+
+    def _table_full(self, key):
+        self.uncounted += 1
+        if self.uncounted == 1:
+            print(f"Shared counter table is full ({self.capacity} slots); {key!r} and other new paths "
+                  f"are not counted. Restart with a larger --counter-slots.")
+
+    def _locate(self, key):
+        digest = key_digest(key)
+        index = digest_index(digest)
+        return digest, index % self._num_stripes, (index // self._num_stripes) % self._slots
+
+    def _find_slot(self, digest, stripe, start, insert):
+        """Byte offset of the slot holding `digest`; claims an empty one if `insert`. Caller holds the lock."""
+        stripe_base = stripe * self._slots
+        for probe in range(self._slots):
+            offset = (stripe_base + (start + probe) % self._slots) * COUNTER_SLOT.size
+            slot_key, _ = COUNTER_SLOT.unpack_from(self._buf, offset)
+            if slot_key == digest:
+                return offset
+            if slot_key == EMPTY_KEY:
+                if not insert:
+                    return None
+                COUNTER_SLOT.pack_into(self._buf, offset, digest, 0)
+                return offset
+        return None  # The stripe is full
+
+    def increment(self, key, amount=1):
+        digest, stripe, start = self._locate(key)
+        with self._locks[stripe]:
+            offset = self._find_slot(digest, stripe, start, insert=True)
+            if offset is not None:
+                _, count = COUNTER_SLOT.unpack_from(self._buf, offset)
+                COUNTER_SLOT.pack_into(self._buf, offset, digest, count + amount)
+                return
+        self._table_full(key)
+
+    def increment_racy(self, key):
+        """Unsynchronized read-modify-write; loses updates across workers. Only used by --no-lock."""
+        digest, stripe, start = self._locate(key)
+        with self._locks[stripe]:
+            offset = self._find_slot(digest, stripe, start, insert=True)
+        if offset is None:
+            self._table_full(key)
+            return
+        _, current = COUNTER_SLOT.unpack_from(self._buf, offset)
+        time.sleep(0.001)  # Delay to force interleaving
+        COUNTER_SLOT.pack_into(self._buf, offset, digest, current + 1)
+
+    def get(self, key):
+        return self.snapshot([key])[0]
+
+    def snapshot(self, keys):
+        """Current totals for `keys`, in order, all as of one instant.
+
+        The stripes the keys live in are locked together, in index order so
+        concurrent snapshots cannot deadlock, and released after the reads.
+        """
+        located = [self._locate(key) for key in keys]
+        stripes = sorted({stripe for _, stripe, _ in located})
+        for stripe in stripes:
+            self._locks[stripe].acquire()
+        try:
+            totals = []
+            for digest, stripe, start in located:
+                offset = self._find_slot(digest, stripe, start, insert=False)
+                totals.append(0 if offset is None else COUNTER_SLOT.unpack_from(self._buf, offset)[1])
+            return totals
+        finally:
+            for stripe in stripes:
+                self._locks[stripe].release()
+
+    def __getitem__(self, key):
+        return self.get(key)
+
+    def release(self):
+        """Free the segment; call once from the process that created it."""
+        self._buf = None
+        self._shm.close()
+        self._shm.unlink()
+
+
+class SharedRateLimiter:
+    """GCRA rate limiter whose per-client state lives in shared memory.
+
+    Drop-in replacement for rate_limiter.RateLimiter in --workers mode, so
+    the limit holds across all worker processes. Clients map to a fixed
+    number of 8-way sets. A slot whose arrival time has passed is
+    equivalent to an unknown client and is reused in place. When every slot
+    in a set is live, the client closest to a full bucket is evicted.
+    Memory is therefore fixed no matter how many IPs connect, and no
+    sweeper thread is needed.
+    """
+
+    def __init__(self, rate, burst=None, num_sets=8192, ways=8, num_locks=32):
+        context = multiprocessing.get_context("fork")
+        self.rate = rate
+        self.burst = burst if burst else max(1, int(rate))
+        self._interval = 1.0 / rate if rate > 0 else 0.0
+        self._tolerance = self._interval * (self.burst - 1)
+        self._num_sets = num_sets
+        self._ways = ways
+        self._table_size = RATE_SLOT.size * num_sets * ways
+        self._shm = shared_memory.SharedMemory(create=True, size=self._table_size + REJECTED_SLOT.size * num_locks)
+        self._buf = self._shm.buf
+        self._locks = [context.Lock() for _ in range(num_locks)]
+
+    def allow(self, client_ip):
+        """Record a request from `client_ip`. Returns True if allowed, False if blocked."""
+        if self.rate <= 0:
+            return True
+        digest = key_digest(client_ip)
+        set_index = digest_index(digest) % self._num_sets
+        lock_index = set_index % len(self._locks)
+        base = set_index * self._ways
+        now = time.monotonic()
+
+        with self._locks[lock_index]:
+            target = None
+            free = None
+            victim, victim_tat = None, None
+            for way in range(self._ways):
+                offset = (base + way) * RATE_SLOT.size
+                slot_key, slot_tat = RATE_SLOT.unpack_from(self._buf, offset)
+                if slot_key == digest:
+                    target = offset
+                    tat = slot_tat
+                    break
+                if slot_key == EMPTY_KEY or slot_tat <= now:
+                    if free is None:
+                        free = offset
+                elif victim_tat is None or slot_tat < victim_tat:
+                    victim, victim_tat = offset, slot_tat
+            if target is None:
+                target = free if free is not None else victim
+                tat = now
+
+            if tat < now:
+                tat = now
+            if tat - now > self._tolerance:
+                rejected_offset = self._table_size + lock_index * REJECTED_SLOT.size
+                REJECTED_SLOT.pack_into(self._buf, rejected_offset, REJECTED_SLOT.unpack_from(self._buf, rejected_offset)[0] + 1)
+                return False
+            RATE_SLOT.pack_into(self._buf, target, digest, tat + self._interval)
+            return True
+
+    def start_sweeper(self):
+        """No-op: expired slots are reclaimed in place by allow()."""
+
+    def rejected_total(self):
+        return sum(
+            REJECTED_SLOT.unpack_from(self._buf, self._table_size + index * REJECTED_SLOT.size)[0]
+            for index in range(len(self._locks))
+        )
+
+    def stats(self):
+        now = time.monotonic()
+        tracked = 0
+        for offset in range(0, self._table_size, RATE_SLOT.size):
+            slot_key, slot_tat = RATE_SLOT.unpack_from(self._buf, offset)
+            if slot_key != EMPTY_KEY and slot_tat > now:
+                tracked += 1
+        return {
+            "rate": self.rate,
+            "burst": self.burst,
+            "tracked_clients": tracked,
+            "capacity": self._num_sets * self._ways,
+            "rejected": self.rejected_total(),
+        }
+
+    def release(self):
+        """Free the segment; call once from the process that created it."""
+        self._buf = None
+        self._shm.close()
+        self._shm.unlink()
@@ -1,10 +1,9 @@
-import requests
+import asyncio
 import time
-import threading
-from concurrent.futures import ThreadPoolExecutor, as_completed
-import statistics
 import socket
 
+from load_generator import HttpConnection, LatencyHistogram, parse_target, run_load
+
 def get_my_ip():
     """Get the local IP address of this machine."""
     try:
@@ -17,27 +16,43 @@ def get_my_ip():
     except:
         return "localhost"
 
-def make_request(url, request_id):
-    """Make a single HTTP request and return timing info."""
-    start = time.time()
+async def make_request_async(url, request_id, timeout=10):
+    """Make a single HTTP request over a raw asyncio socket and return timing info."""
+    host, port, path = parse_target(url)
+    connection = HttpConnection(host, port, keep_alive=False)
+    start = time.perf_counter()
     try:
-        response = requests.get(url, timeout=10)
-        end = time.time()
+        status, _ = await connection.request(path, timeout)
         return {
             'id': request_id,
-            'status': response.status_code,
-            'duration': end - start,
-            'success': response.status_code == 200
+            'status': status,
+            'duration': time.perf_counter() - start,
+            'success': status == 200
         }
     except Exception as e:
-        end = time.time()
         return {
             'id': request_id,
             'status': 'error',
-            'duration': end - start,
+            'duration': time.perf_counter() - start,
             'success': False,
-            'error': str(e)
+            'error': str(e) or type(e).__name__
         }
+    finally:
+        connection.close()
+
+
+def make_request(url, request_id):
+    """Make a single HTTP request and return timing info."""
+    return asyncio.run(make_request_async(url, request_id))
+
+
+def print_latency(histogram):
+    """Print latency percentiles from a LatencyHistogram."""
+    summary = histogram.summary()
+    if summary['count']:
+        print(f"Latency: p50={summary['p50_ms']:.1f}ms p90={summary['p90_ms']:.1f}ms "
+              f"p99={summary['p99_ms']:.1f}ms p99.9={summary['p99.9_ms']:.1f}ms max={summary['max_ms']:.1f}ms")
+
 
 def test_concurrent_requests(url, num_requests=10):
     """Test server with concurrent requests."""
@@ -45,134 +60,113 @@ def test_concurrent_requests(url, num_requests=10):
     print(f"Testing with {num_requests} concurrent requests")
     print(f"URL: {url}")
     print(f"{'='*60}\n")
-    
-    start_time = time.time()
-    results = []
-    
-    # Make concurrent requests
-    with ThreadPoolExecutor(max_workers=num_requests) as executor:
-        futures = [
-            executor.submit(make_request, url, i) 
-            for i in range(num_requests)
-        ]
-        
-        for future in as_completed(futures):
-            result = future.result()
+
+    async def run_all():
+        tasks = [asyncio.ensure_future(make_request_async(url, i)) for i in range(num_requests)]
+        results = []
+        for future in asyncio.as_completed(tasks):
+            result = await future
             results.append(result)
             status = "✓" if result['success'] else "✗"
             print(f"{status} Request {result['id']}: "
                   f"Status={result['status']}, "
                   f"Duration={result['duration']:.3f}s")
-    
-    end_time = time.time()
-    total_time = end_time - start_time
-    
+        return results
+
+    start_time = time.perf_counter()
+    results = asyncio.run(run_all())
+    total_time = time.perf_counter() - start_time
+
     # Calculate statistics
     successful = [r for r in results if r['success']]
-    durations = [r['duration'] for r in successful]
-    
+    histogram = LatencyHistogram()
+    for r in successful:
+        histogram.record(r['duration'])
+
     print(f"\n{'='*60}")
     print("RESULTS:")
     print(f"{'='*60}")
     print(f"Total time: {total_time:.3f}s")
     print(f"Successful requests: {len(successful)}/{num_requests}")
-    
-    if durations:
-        print(f"Average request duration: {statistics.mean(durations):.3f}s")
-        print(f"Min request duration: {min(durations):.3f}s")
-        print(f"Max request duration: {max(durations):.3f}s")
+
+    if successful:
+        print(f"Average request duration: {histogram.total / histogram.count:.3f}s")
+        print(f"Min request duration: {histogram.min:.3f}s")
+        print(f"Max request duration: {histogram.max:.3f}s")
+        print_latency(histogram)
         print(f"Throughput: {len(successful)/total_time:.2f} requests/second")
-    
+
     return total_time, len(successful)
 
+
 def test_race_condition(url, num_requests=50):
     """Test counter race condition by making many concurrent requests to the same file."""
     print(f"\n{'='*60}")
     print(f"Testing RACE CONDITION with {num_requests} concurrent requests")
     print(f"URL: {url}")
     print(f"{'='*60}\n")
-    
-    with ThreadPoolExecutor(max_workers=num_requests) as executor:
-        futures = [executor.submit(make_request, url, i) for i in range(num_requests)]
-        results = [f.result() for f in as_completed(futures)]
-    
+
+    async def run_all():
+        return await asyncio.gather(*(make_request_async(url, i) for i in range(num_requests)))
+
+    results = asyncio.run(run_all())
+
     successful = len([r for r in results if r['success']])
     print(f"\nCompleted {successful} successful requests")
     print(f"Check the directory listing to see if counter shows {successful}")
     print(f"If it shows less, there's a race condition!")
 
+
 def test_rate_limiting(url, requests_per_second, duration_seconds=10):
-    """Test rate limiting by sending requests at a controlled rate."""
+    """Test rate limiting by sending requests at a fixed arrival rate (open loop)."""
     print(f"\n{'='*60}")
     print(f"Testing RATE LIMITING: {requests_per_second} requests/second for {duration_seconds}s")
     print(f"URL: {url}")
     print(f"{'='*60}\n")
-    
-    delay = 1.0 / requests_per_second
-    start_time = time.time()
-    results = []
-    request_count = 0
-    
-    while time.time() - start_time < duration_seconds:
-        result = make_request(url, request_count)
-        results.append(result)
-        
-        status_symbol = "✓" if result['success'] else "✗"
-        if result['status'] == 429:
-            print(f"{status_symbol} Request {request_count}: RATE LIMITED (429)")
-        else:
-            print(f"{status_symbol} Request {request_count}: {result['status']}")
-        
-        request_count += 1
-        time.sleep(delay)
-    
-    total_time = time.time() - start_time
-    successful = [r for r in results if r['success']]
-    rate_limited = [r for r in results if r['status'] == 429]
-    
+
+    result = run_load(url, mode="open", rate=requests_per_second, duration=duration_seconds)
+    summary = result.summary()
+    total = summary['completed'] + summary['errors']
+    successful = result.statuses.get(200, 0)
+    rate_limited = result.statuses.get(429, 0)
+
     print(f"\n{'='*60}")
     print("RATE LIMITING RESULTS:")
     print(f"{'='*60}")
-    print(f"Total requests: {len(results)}")
-    print(f"Successful: {len(successful)}")
-    print(f"Rate limited (429): {len(rate_limited)}")
-    print(f"Actual rate: {len(results)/total_time:.2f} requests/second")
-    print(f"Success rate: {len(successful)/total_time:.2f} requests/second")
+    print(f"Total requests: {total}")
+    print(f"Successful: {successful}")
+    print(f"Rate limited (429): {rate_limited}")
+    print(f"Errors: {summary['errors']}")
+    print(f"Actual rate: {total/result.elapsed:.2f} requests/second")
+    print(f"Success rate: {successful/result.elapsed:.2f} requests/second")
+    print_latency(result.latency)
+
 
-def spam_requests(url, duration_seconds=5):
-    """Spam server with requests as fast as possible."""
+def spam_requests(url, duration_seconds=5, concurrency=10):
+    """Spam server with requests as fast as possible (closed loop)."""
     print(f"\n{'='*60}")
-    print(f"SPAMMING server for {duration_seconds} seconds")
+    print(f"SPAMMING server for {duration_seconds} seconds with {concurrency} concurrent clients")
     print(f"URL: {url}")
     print(f"{'='*60}\n")
-    
-    start_time = time.time()
-    results = []
-    request_count = 0
-    
-    while time.time() - start_time < duration_seconds:
-        result = make_request(url, request_count)
-        results.append(result)
-        request_count += 1
-        
-        # Print every 10th request
-        if request_count % 10 == 0:
-            rate_limited = len([r for r in results if r['status'] == 429])
-            print(f"Sent {request_count} requests, {rate_limited} rate-limited so far...")
-    
-    total_time = time.time() - start_time
-    successful = [r for r in results if r['success']]
-    rate_limited = [r for r in results if r['status'] == 429]
-    
+
+    result = run_load(url, mode="closed", concurrency=concurrency, duration=duration_seconds)
+    summary = result.summary()
+    total = summary['completed'] + summary['errors']
+    successful = result.statuses.get(200, 0)
+    rate_limited = result.statuses.get(429, 0)
+
     print(f"\n{'='*60}")
     print("SPAM RESULTS:")
     print(f"{'='*60}")
-    print(f"Total requests: {len(results)}")
-    print(f"Successful: {len(successful)}")
-    print(f"Rate limited (429): {len(rate_limited)}")
-    print(f"Request rate: {len(results)/total_time:.2f} requests/second")
-    print(f"Success throughput: {len(successful)/total_time:.2f} requests/second")
-    print(f"Rate limit effectiveness: {len(rate_limited)/len(results)*100:.1f}% blocked")
+    print(f"Total requests: {total}")
+    print(f"Successful: {successful}")
+    print(f"Rate limited (429): {rate_limited}")
+    print(f"Request rate: {total/result.elapsed:.2f} requests/second")
+    print(f"Success throughput: {successful/result.elapsed:.2f} requests/second")
+    if total:
+        print(f"Rate limit effectiveness: {rate_limited/total*100:.1f}% blocked")
+    print_latency(result.latency)
+
 
 if __name__ == "__main__":
     import argparse
@@ -0,0 +1,111 @@
+import collections
+import itertools
+import threading
+import time
+
+
+class AdaptiveThreadPool:
+    """Thread pool that grows under load and shrinks when idle.
+
+    Starts `min_workers` threads. A submit that finds no idle thread
+    starts another one, up to `max_workers`, so blocked workers (slow
+    disks, the --delay simulation) do not leave new requests queued while
+    the machine sits idle. A worker that finds no work for
+    `idle_timeout` seconds exits, down to `min_workers`. A drop-in for
+    the ThreadPoolExecutor usage in the server: submit(), shutdown() and
+    use as a context manager. submit() returns nothing; results and
+    exceptions are not collected, only printed.
+    """
+
+    def __init__(self, min_workers=4, max_workers=64, idle_timeout=10.0, name="worker"):
+        if not 0 < max_workers or not 0 <= min_workers <= max_workers:
+            raise ValueError("Need 0 <= min_workers <= max_workers and max_workers > 0")
+        self.min_workers = min_workers
+        self.max_workers = max_workers
+        self.idle_timeout = idle_timeout
+        self._name = name
+        self._queue = collections.deque()
+        self._condition = threading.Condition()
+        self._threads = 0
+        self._idle = 0
+        self._shutdown = False
+        self._names = itertools.count()
+        self.peak = 0
+        self.started = 0
+        self.retired = 0
+        with self._condition:
+            for _ in range(min_workers):
+                self._start_thread()
+
+    def _start_thread(self):
+        """Start one worker. Caller holds the condition."""
+        self._threads += 1
+        self.started += 1
+        self.peak = max(self.peak, self._threads)
+        thread = threading.Thread(target=self._work, name=f"{self._name}-{next(self._names)}", daemon=True)
+        thread.start()
+
+    def submit(self, fn, *args):
+        with self._condition:
+            if self._shutdown:
+                raise RuntimeError("Cannot submit after shutdown")
+            self._queue.append((fn, args))
+            # Every thread is busy, or already claimed by earlier submits: grow
+            if self._idle < len(self._queue) and self._threads < self.max_workers:
+                self._start_thread()
+            else:
+                self._condition.notify()
+
+    def _work(self):
+        while True:
+            with self._condition:
+                self._idle += 1
+                while not self._queue and not self._shutdown:
+                    timed_out = not self._condition.wait(self.idle_timeout)
+                    if timed_out and not self._queue and self._threads > self.min_workers:
+                        # No work for a whole timeout: give the thread back
+                        self._idle -= 1
+                        self._threads -= 1
+                        self.retired += 1
+                        return
+                self._idle -= 1
+                if not self._queue:
+                    self._threads -= 1
+                    return  # Shut down and drained
+                fn, args = self._queue.popleft()
+            try:
+                fn(*args)
+            except Exception as e:
+                print("Error in worker thread:", e)
+
+    def size(self):
+        """Current number of worker threads."""
+        return self._threads
+
+    def stats(self):
+        with self._condition:
+            return {
+                "threads": self._threads,
+                "idle": self._idle,
+                "queued": len(self._queue),
+                "min": self.min_workers,
+                "max": self.max_workers,
+                "peak": self.peak,
+                "started": self.started,
+                "retired": self.retired,
+            }
+
+    def shutdown(self, wait=True):
+        """Stop accepting work; workers exit once the queue is drained."""
+        with self._condition:
+            self._shutdown = True
+            self._condition.notify_all()
+        while wait and self._threads:
+            time.sleep(0.01)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown(wait=False)
+        return False